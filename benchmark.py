@@ -0,0 +1,313 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from config import build_arg_parser, get_config, load_config
+from frame_sources import FrameListSource
+from metrics import metrics
+from registry import registry
+from warmup import load_backend
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+RESULTS_DIR = "benchmarks"
+
+# backend -> (module that registers it, registry name, call on one frame)
+BACKENDS = {
+    'reco': ('model4.reco', 'reco', lambda engine, frame: engine.recognize_objects(frame)),
+    'face': ('model3.face_detection', 'face', lambda engine, frame: engine.recognize_faces(frame)),
+    'ocr': ('model2.ocr', 'ocr', lambda engine, frame: engine.perform_ocr(frame)),
+}
+PIPELINE_MODES = {'pipeline-reco': 1, 'pipeline-face': 2, 'pipeline-ocr': 3}
+
+
+def load_frames(sources: List[str], limit: Optional[int] = None) -> List[np.ndarray]:
+    """Frames from image directories, single images and video files, in a stable order"""
+    frames = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths = sorted(p for ext in IMAGE_EXTENSIONS
+                           for p in glob.glob(os.path.join(source, f"*.{ext}")))
+            frames += [f for f in (cv2.imread(p) for p in paths) if f is not None]
+        elif source.lower().endswith(VIDEO_EXTENSIONS):
+            cap = cv2.VideoCapture(source)
+            while limit is None or len(frames) < limit:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            cap.release()
+        else:
+            frame = cv2.imread(source)
+            if frame is not None:
+                frames.append(frame)
+    return frames[:limit]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KiB on Linux
+    except ImportError:
+        import psutil  # Windows
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000
+    if not len(values):
+        return {}
+    return {
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def reset_caches(engine):
+    """Forget previous frames so every measurement is a cold call"""
+    for name in ('result_cache', 'region_cache'):
+        cache = getattr(engine, name, None)
+        if cache is not None:
+            cache.clear()
+    tracker = getattr(engine, 'tracker', None)
+    if tracker is not None:
+        tracker.clear()
+
+
+class NullSpeaker:
+    def __init__(self):
+        """Speech sink that only records what would have been said"""
+        self.spoken = []
+
+    def __call__(self, text, streamed=False):
+        self.spoken.append(text)
+
+
+def bench_backend(name: str, frames: List[np.ndarray], repeat=1, warm_caches=False) -> Dict:
+    """Import/startup time, then per-frame latency of one backend"""
+    module, key, call = BACKENDS[name]
+    start = time.perf_counter()
+    __import__(module)
+    import_s = time.perf_counter() - start
+
+    registry.unload(key)
+    start = time.perf_counter()
+    engine = registry.load(key)
+    startup_s = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for frame in frames:
+            if not warm_caches:
+                reset_caches(engine)
+            start = time.perf_counter()
+            call(engine, frame)
+            latencies.append(time.perf_counter() - start)
+
+    return {
+        'import_s': import_s,
+        'startup_s': startup_s,
+        'frames': len(latencies),
+        'throughput_fps': len(latencies) / sum(latencies) if latencies else 0.0,
+        **latency_summary(latencies),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_pipeline(name: str, frames: List[np.ndarray], fps=15.0, loops=1, scheduler=False) -> Dict:
+    """The main.py pipeline for one mode, fed by replayed frames and speaking into a null sink"""
+    import main
+    from pipeline import Pipeline
+    from scheduler import AdaptiveScheduler
+
+    mode = PIPELINE_MODES[name]
+    start = time.perf_counter()
+    models = main.load_models()
+    for backend in main.MODE_MODELS[mode]:
+        load_backend(backend)
+    startup_s = time.perf_counter() - start
+
+    camera = FrameListSource(frames, fps=fps, loops=loops)
+    speaker = NullSpeaker()
+    pipeline = Pipeline(
+        camera.read,
+        lambda mode, frame: main.analyse(models, mode, frame),
+        speaker,
+        mode=mode,
+        workers=get_config().pipeline.inference_workers,
+        scheduler=AdaptiveScheduler.from_config(get_config().pipeline) if scheduler else None,
+        on_demand=get_config().pipeline.capture_on_demand,
+    )
+    start = time.perf_counter()
+    pipeline.start()
+    while pipeline.running():
+        time.sleep(0.05)
+    pipeline.stop()
+    wall_s = time.perf_counter() - start
+
+    stats = pipeline.stats()
+    analysed = stats['inference']['count']
+    stages = metrics.snapshot()['stages']
+    return {
+        'startup_s': startup_s,
+        'wall_s': wall_s,
+        'frames_captured': camera.served,
+        'frames_analysed': analysed,
+        'throughput_fps': analysed / wall_s if wall_s else 0.0,
+        'utterances': len(speaker.spoken),
+        'inference': stages.get('pipeline.inference', {}),
+        'end_to_end': stages.get('pipeline.end_to_end', {}),
+        'first_word': stages.get('pipeline.first_word', {}),
+        'queues': stats['queues'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_one(name: str, frames: List[np.ndarray], args) -> Dict:
+    metrics.reset()
+    metrics.enabled = True
+    if name in BACKENDS:
+        result = bench_backend(name, frames, args.repeat, args.warm_caches)
+    else:
+        result = bench_pipeline(name, frames, args.fps, args.repeat, args.scheduler)
+    result['stages'] = metrics.snapshot()['stages']
+    return result
+
+
+def run_isolated(name: str, argv: List[str]) -> Dict:
+    """Run one benchmark in a fresh interpreter so startup time and peak RSS are its own"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'result.json')
+        cmd = [sys.executable, os.path.abspath(__file__), *argv,
+               '--backends', name, '--no-isolate', '--output', output]
+        completed = subprocess.run(cmd)
+        if completed.returncode != 0 or not os.path.exists(output):
+            return {'error': f"exit code {completed.returncode}"}
+        with open(output) as f:
+            return json.load(f)['results'][name]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path: str, new_path: str):
+    """Print latency/throughput changes between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'benchmark':<16}{'metric':<16}{'old':>10}{'new':>10}{'change':>9}")
+    for name, result in new['results'].items():
+        before = old['results'].get(name, {})
+        for metric in ('startup_s', 'throughput_fps', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb'):
+            if metric in result and metric in before and before[metric]:
+                change = (result[metric] - before[metric]) / before[metric]
+                print(f"{name:<16}{metric:<16}{before[metric]:>10.1f}{result[metric]:>10.1f}{change:>+9.0%}")
+
+
+def print_report(report: Dict):
+    print(f"{'benchmark':<16}{'startup s':>10}{'fps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>9}")
+    for name, r in report['results'].items():
+        if 'error' in r:
+            print(f"{name:<16} failed: {r['error']}")
+            continue
+        latency = r if 'p50_ms' in r else r.get('end_to_end', {})
+        print(f"{name:<16}{r['startup_s']:>10.2f}{r['throughput_fps']:>8.2f}"
+              f"{latency.get('p50_ms', 0):>9.0f}{latency.get('p95_ms', 0):>9.0f}"
+              f"{latency.get('p99_ms', 0):>9.0f}{r['peak_rss_mb']:>9.0f}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description="Replay recorded frames through Nayan's backends")
+    parser.add_argument('sources', nargs='*', default=['captures', os.path.join('model3', 'images')],
+                        help="image directories, images or video files")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS) + list(PIPELINE_MODES),
+                        choices=list(BACKENDS) + list(PIPELINE_MODES))
+    parser.add_argument('--limit', type=int, default=None, help="use at most this many frames")
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the frames")
+    parser.add_argument('--warm-caches', action='store_true', help="keep result caches between frames")
+    parser.add_argument('--fps', type=float, default=15.0, help="replay rate for pipeline runs")
+    parser.add_argument('--scheduler', action='store_true', help="use the adaptive scheduler in pipeline runs")
+    parser.add_argument('--no-isolate', dest='isolate', action='store_false',
+                        help="run every benchmark in this process")
+    parser.add_argument('--output', help=f"result file (default: {RESULTS_DIR}/<commit>_<time>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="diff two result files and exit")
+    args, _ = parser.parse_known_args(argv)
+    load_config(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    frames = load_frames(args.sources, args.limit)
+    if not frames:
+        print(f"No readable frames in {', '.join(args.sources)}")
+        return 1
+
+    # Children get the same frames, options and config; the parent picks backend and output
+    config_args, _ = build_arg_parser().parse_known_args(argv)
+    child_argv = [*args.sources, '--repeat', str(args.repeat), '--fps', str(args.fps)]
+    child_argv += ['--limit', str(args.limit)] if args.limit is not None else []
+    child_argv += ['--warm-caches'] if args.warm_caches else []
+    child_argv += ['--scheduler'] if args.scheduler else []
+    child_argv += ['--config', config_args.config] if config_args.config else []
+    child_argv += ['--profile', config_args.profile] if config_args.profile else []
+    for override in config_args.set:
+        child_argv += ['--set', override]
+
+    commit = git_commit()
+    results = {}
+    for name in args.backends:
+        print(f"Benchmarking {name} on {len(frames)} frames...")
+        results[name] = run_isolated(name, child_argv) if args.isolate else run_one(name, frames, args)
+
+    report = {
+        'commit': commit,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'profile': get_config().profile,
+        'sources': args.sources,
+        'frames': len(frames),
+        'repeat': args.repeat,
+        'warm_caches': args.warm_caches,
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'unknown'}_{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    print(f"Results written to {output}")
+    return 0
+
+
+# Usage: python benchmark.py captures model3/images --backends reco ocr pipeline-reco
+#        python benchmark.py --compare benchmarks/old.json benchmarks/new.json
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+from typing import Dict, List
+
+import numpy as np
+
+from config import get_config
+from metrics import metrics
+from registry import registry
+from model4.tracker import ObjectTracker
+from warmup import import_backend
+
+
+class CascadeAnalyser:
+    def __init__(self):
+        """
+        "Auto" mode: YOLO on every analysed frame, heavier models only on the boxes that need them
+        Person boxes go to face detection/encoding on the head region, text-likely objects go
+        to OCR on their crop; frames without such boxes never touch the face or OCR models.
+        """
+        self._texts: Dict[int, str] = {}  # object track id -> text already read from it
+        self.skipped = 0  # frames where only YOLO ran
+        # Registers the backends (nothing is built until first use); worker-process proxies
+        # are used as they are, without importing their modules here
+        for name in ('reco', 'face', 'ocr'):
+            import_backend(name)
+
+    def reset(self):
+        self._texts = {}
+        reco = registry.peek('reco')
+        if reco is not None:
+            reco.reset_tracking()
+
+    def analyse(self, frame: np.ndarray) -> List[str]:
+        """
+        :param frame: BGR frame
+        :return: Phrases to speak: object changes, arrivals of people, newly read text
+        """
+        cfg = get_config().auto
+        reco = registry.get('reco')
+        visible, changes = reco.track(frame)
+        phrases = ObjectTracker.describe_changes(changes)
+
+        def area(track):
+            x1, y1, x2, y2 = track.box
+            return (x2 - x1) * (y2 - y1)
+
+        people = [t for t in visible if t.label in cfg.person_classes
+                  and t.box[3] - t.box[1] >= cfg.min_person_height]
+        people = sorted(people, key=area, reverse=True)[:cfg.max_crops]
+
+        # Text is read once per tracked object, not on every frame it stays in view
+        live_ids = reco.track_ids()
+        self._texts = {k: v for k, v in self._texts.items() if k in live_ids}
+        min_width = cfg.min_text_width * frame.shape[1]
+        texts = [t for t in visible if t.label in cfg.text_classes and t.track_id not in self._texts
+                 and t.box[2] - t.box[0] >= min_width]
+        texts = sorted(texts, key=area, reverse=True)[:cfg.max_crops]
+
+        if not people and not texts:
+            self.skipped += 1
+            metrics.inc("auto.heavy_skipped")
+            return phrases
+
+        if people:
+            with metrics.timer("auto.face"):
+                names = registry.get('face').recognize_new_faces(frame, [t.box for t in people])
+            if names:
+                phrases.append(f"I think this is {', '.join(names)}")
+
+        if texts:
+            with metrics.timer("auto.ocr"):
+                read = registry.get('ocr').read_in_regions(frame, [t.box for t in texts])
+            for track, text in zip(texts, read):
+                if text:  # an empty read (blur, glare, too far) is retried on the next frame
+                    self._texts[track.track_id] = text
+                    phrases.append(f"The {track.label} reads: {text}")
+        return phrases
+
+
+registry.register('auto', CascadeAnalyser)
+
+
+# The following function is what will be imported by the main application
+def analyse_auto(image: np.ndarray) -> List[str]:
+    """
+    Cascaded analysis of one frame (objects, then faces and text only where they are likely)
+    :param image: BGR frame
+    :return: Phrases to speak (empty when nothing changed)
+    """
+    try:
+        return registry.get('auto').analyse(image)
+    except Exception as e:
+        print(f"Auto mode error: {str(e)}")
+        return []
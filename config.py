@@ -0,0 +1,361 @@
+import argparse
+import dataclasses
+import json
+import os
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+ENV_PREFIX = "NAYAN_"
+DEFAULT_CONFIG_FILE = "nayan.json"  # also nayan.yaml / nayan.yml when PyYAML is installed
+
+
+@dataclass
+class PipelineConfig:
+    capture_dir: str = "captures"
+    debug_capture: bool = False  # keep processed frames on disk
+    cpu_budget: float = 0.5  # fraction of wall time inference may use
+    min_process_interval: float = 0.1  # never analyse more often than this (seconds)
+    max_process_interval: float = 15.0  # re-analyse an unchanged scene after this long (seconds)
+    scene_change_threshold: float = 0.04  # mean thumbnail difference that counts as a new scene
+    scene_check_interval: float = 0.5  # seconds between change checks while the scene is static
+    inference_workers: int = 1
+    stats_interval: float = 30.0  # seconds between latency reports (0 disables)
+    model_idle_timeout: Optional[float] = None  # unload unused models after this long (None keeps all warm)
+    config_poll_interval: float = 5.0  # seconds between config file change checks (0 disables)
+    capture_on_demand: bool = True  # read a frame only when inference is ready for one
+    warm_all_models: bool = True  # after the default mode's model, load the others in the background
+    process_backends: bool = False  # run reco/face/ocr in worker processes instead of threads
+    worker_threads: int = 2  # native (torch/OpenMP/OpenCV) threads per worker process
+    worker_timeout: float = 30.0  # seconds a worker may take per call before it is restarted
+
+
+@dataclass
+class SourceConfig:
+    kind: str = "camera"  # camera / video / images / synthetic
+    path: Optional[str] = None  # camera index, video file, image directory or synthetic pattern
+    width: Optional[int] = None  # capture resolution (None keeps the native size)
+    height: Optional[int] = None
+    fps: Optional[float] = None  # capture rate (None: camera default, file rate, 1 fps for images)
+    mjpeg: bool = False  # ask the camera for MJPEG
+    hw_decode: bool = False  # hardware-accelerated decoding where OpenCV supports it
+    loop: bool = False  # restart videos (image directories always loop)
+    realtime: bool = True  # play videos at their own rate, dropping frames like a camera
+    latest_only: bool = True  # grab continuously but decode only the frame that gets analysed
+
+
+@dataclass
+class SpeechConfig:
+    rate: int = 150  # words per minute
+    volume: float = 0.9
+    max_age: float = 5.0  # seconds before a queued result is dropped unspoken
+    coalesce_window: float = 10.0  # seconds during which an identical announcement is skipped
+    cache_enabled: bool = True  # play recurring phrases from pre-rendered clips
+    cache_dir: str = "speech_cache"
+    cache_max_mb: float = 50.0  # least recently used clips are deleted above this
+    cache_compose: bool = True  # build sentences from cached fragments ("I see" + "2" + "chairs")
+    cache_vocabulary: List[str] = field(default_factory=list)  # extra phrases to render ahead of time
+
+
+@dataclass
+class ObjectConfig:
+    model_size: str = "l"  # n / s / m / l
+    backend: str = "pytorch"  # pytorch / torchscript / onnx / openvino
+    imgsz: int = 640
+    conf_threshold: float = 0.4
+    close_threshold: float = 0.2  # box width / frame width above which an object is "close"
+    batch_size: int = 8
+    track_low_conf: float = 0.1  # detections between this and conf_threshold only extend existing tracks
+    track_iou: float = 0.3  # minimum IoU to continue a track
+    track_max_misses: int = 2  # analysed frames before an unseen object counts as gone
+    track_min_hits: int = 2  # detections before a new object is announced
+
+
+@dataclass
+class FaceConfig:
+    detector: str = "hog"  # hog / cnn / dnn
+    frame_resizing: float = 0.25  # first rung of the detection resolution ladder
+    ladder_scales: Tuple[float, ...] = (0.5,)
+    refine_on_crops: bool = True
+    confidence_threshold: float = 0.6
+    unsure_threshold: float = 0.8
+    watch_interval: Optional[float] = 5.0  # seconds between enrollment directory scans
+    track_max_misses: int = 2  # analysed frames a face stays tracked (and unannounced) after it is lost
+
+
+@dataclass
+class OCRConfig:
+    languages: List[str] = field(default_factory=lambda: ["en", "hi"])
+    model_dir: str = os.path.join("model2", "model_cache")
+    auto_script: bool = True
+    target_width: int = 1280
+    decoder: str = "greedy"
+    beam_width: int = 3
+    beam_threshold: float = 0.5
+    batch_size: int = 4
+    idle_timeout: float = 300.0  # seconds before an unused secondary recogniser is evicted
+    repeat_after: float = 120.0  # seconds before a line already read aloud is read again
+
+
+@dataclass
+class AutoConfig:
+    person_classes: List[str] = field(default_factory=lambda: ["person"])  # sent to face recognition
+    text_classes: List[str] = field(default_factory=lambda: ["book", "laptop", "cell phone", "tv", "stop sign"])
+    min_person_height: int = 80  # pixels; smaller people are too far for face recognition
+    min_text_width: float = 0.1  # box width / frame width; smaller objects are too far to read
+    max_crops: int = 2  # largest boxes per model per frame
+
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = False  # when off, timers and counters cost one attribute check
+    export_interval: float = 30.0  # seconds between exports
+    log: bool = True  # print a rolling summary line
+    json_path: Optional[str] = None  # e.g. captures/metrics.json
+    prometheus_port: Optional[int] = None  # serve /metrics on 127.0.0.1:<port>
+
+
+@dataclass
+class Config:
+    profile: str = "default"
+    source: SourceConfig = field(default_factory=SourceConfig)
+    pipeline: PipelineConfig = field(default_factory=PipelineConfig)
+    speech: SpeechConfig = field(default_factory=SpeechConfig)
+    objects: ObjectConfig = field(default_factory=ObjectConfig)
+    face: FaceConfig = field(default_factory=FaceConfig)
+    ocr: OCRConfig = field(default_factory=OCRConfig)
+    auto: AutoConfig = field(default_factory=AutoConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+
+
+# Per-device overrides applied on top of the defaults
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "desktop": {
+        "pipeline.cpu_budget": 0.8,
+        "pipeline.inference_workers": 2,
+        "objects.model_size": "l",
+        "ocr.target_width": 1600,
+    },
+    "low-power": {
+        "source.width": 640,
+        "source.height": 480,
+        "source.fps": 15.0,
+        "pipeline.cpu_budget": 0.3,
+        "pipeline.max_process_interval": 20.0,
+        "pipeline.model_idle_timeout": 300.0,
+        "pipeline.warm_all_models": False,
+        "objects.model_size": "n",
+        "objects.backend": "pytorch",  # onnx is faster on CPU but needs the onnx/onnxruntime packages
+        "objects.imgsz": 416,
+        "face.ladder_scales": [],
+        "ocr.languages": ["en"],
+        "ocr.target_width": 960,
+        "ocr.idle_timeout": 60.0,
+    },
+}
+
+# Fields baked into a loaded model; changing them reloads that model instead of applying live
+RESTART_FIELDS = {
+    "objects.model_size", "objects.backend", "objects.imgsz",
+    "ocr.languages", "ocr.model_dir",
+    "speech.cache_enabled", "speech.cache_dir",
+    "pipeline.inference_workers", "pipeline.capture_on_demand",  # need an application restart
+    "pipeline.process_backends", "pipeline.worker_threads", "pipeline.worker_timeout",
+}
+
+# Sections read once at startup; changing them needs an application restart
+STARTUP_SECTIONS = {"source"}
+
+# Older environment switches that still work
+ENV_ALIASES = {"NAYAN_DEBUG_CAPTURE": "pipeline.debug_capture"}
+
+# Registry name of each backend -> config section it reads
+SECTIONS = {"tts": "speech", "reco": "objects", "face": "face", "ocr": "ocr"}
+
+
+def _coerce(value: Any, annotation) -> Any:
+    """Convert strings from env/CLI (and JSON lists) to the field's declared type"""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:  # Optional[X]
+        if value is None or (isinstance(value, str) and value.lower() in ("none", "null", "")):
+            return None
+        return _coerce(value, next(a for a in args if a is not type(None)))
+    if origin in (list, tuple):
+        if isinstance(value, str):
+            value = [v for v in value.split(",") if v.strip()]
+        items = [_coerce(v, args[0]) for v in value]
+        return tuple(items) if origin is tuple else items
+    if annotation is bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    if annotation in (int, float, str):
+        return annotation(value.strip() if isinstance(value, str) else value)
+    return value
+
+
+def _field_types(section) -> Dict[str, Any]:
+    return typing.get_type_hints(type(section))
+
+
+def set_value(config: Config, key: str, value: Any):
+    """Set "section.field" with type conversion; unknown keys are an error"""
+    section_name, _, name = key.partition(".")
+    section = getattr(config, section_name, None)
+    if section is None or not dataclasses.is_dataclass(section) or not hasattr(section, name):
+        raise KeyError(f"Unknown config key '{key}'")
+    setattr(section, name, _coerce(value, _field_types(section)[name]))
+
+
+def flatten(config: Config) -> Dict[str, Any]:
+    """{"section.field": value} for every field"""
+    flat = {}
+    for f in dataclasses.fields(config):
+        section = getattr(config, f.name)
+        if dataclasses.is_dataclass(section):
+            for name, value in dataclasses.asdict(section).items():
+                flat[f"{f.name}.{name}"] = value
+    return flat
+
+
+def _read_file(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f) or {}
+        else:
+            data = json.load(f)
+    # Accept both {"objects": {"imgsz": 416}} and {"objects.imgsz": 416}
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update({f"{key}.{k}": v for k, v in value.items()})
+        else:
+            flat[key] = value
+    return flat
+
+
+def build_arg_parser(parser: Optional[argparse.ArgumentParser] = None) -> argparse.ArgumentParser:
+    parser = parser or argparse.ArgumentParser(description="Nayan assistive vision")
+    parser.add_argument("--config", help=f"JSON/YAML config file (default: {DEFAULT_CONFIG_FILE} if present)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), help="device profile")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.FIELD=VALUE",
+                        help="override one setting, e.g. --set objects.imgsz=416")
+    return parser
+
+
+class ConfigLoader:
+    def __init__(self, path: Optional[str] = None, profile: Optional[str] = None,
+                 overrides: Optional[List[str]] = None):
+        """
+        Defaults < profile < config file < environment < command line
+        :param path: Config file; defaults to nayan.json / nayan.yaml in the working directory
+        :param profile: Device profile name (also settable as "profile" in the file or NAYAN_PROFILE)
+        :param overrides: "section.field=value" strings from the command line
+        """
+        if path is None:
+            path = next((p for p in (DEFAULT_CONFIG_FILE, "nayan.yaml", "nayan.yml") if os.path.exists(p)), None)
+        self.path = path
+        self.profile = profile
+        self.overrides = list(overrides or [])
+        self._mtime = self._file_mtime()
+
+    def _file_mtime(self) -> Optional[float]:
+        return os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+
+    def load(self) -> Config:
+        self._mtime = self._file_mtime()  # a broken edit is reported once, not on every poll
+        file_values = _read_file(self.path) if self.path and os.path.exists(self.path) else {}
+        profile = (self.profile or os.environ.get(ENV_PREFIX + "PROFILE")
+                   or file_values.pop("profile", None) or "default")
+        file_values.pop("profile", None)
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile '{profile}' (choose from {', '.join(PROFILES)})")
+
+        config = Config(profile=profile)
+        for key, value in PROFILES[profile].items():
+            set_value(config, key, value)
+        for key, value in file_values.items():
+            set_value(config, key, value)
+
+        # NAYAN_OBJECTS_IMGSZ=416 -> objects.imgsz
+        keys = flatten(config)
+        for env_key, value in os.environ.items():
+            if env_key in ENV_ALIASES:
+                set_value(config, ENV_ALIASES[env_key], value)
+            elif env_key.startswith(ENV_PREFIX):
+                section, _, name = env_key[len(ENV_PREFIX):].lower().partition("_")
+                if f"{section}.{name}" in keys:
+                    set_value(config, f"{section}.{name}", value)
+
+        for override in self.overrides:
+            key, sep, value = override.partition("=")
+            if not sep:
+                raise ValueError(f"Expected SECTION.FIELD=VALUE, got '{override}'")
+            set_value(config, key.strip(), value)
+        return config
+
+    def file_changed(self) -> bool:
+        return self._file_mtime() != self._mtime
+
+
+_loader = ConfigLoader()
+_current = Config()
+
+
+def get_config() -> Config:
+    """The active configuration (defaults until load_config() runs)"""
+    return _current
+
+
+def load_config(argv: Optional[List[str]] = None) -> Config:
+    """Parse --config/--profile/--set (other arguments are ignored) and make the result active"""
+    global _loader, _current
+    args, _ = build_arg_parser().parse_known_args(argv)
+    _loader = ConfigLoader(args.config, args.profile, args.set)
+    _current = _loader.load()
+    return _current
+
+
+def config_file_changed() -> bool:
+    return _loader.file_changed()
+
+
+def reload_config() -> Tuple[Config, List[str]]:
+    """
+    Re-read every source and apply the differences to the loaded backends
+    :return: (new config, keys that changed)
+    """
+    global _current
+    new = _loader.load()
+    before, after = flatten(_current), flatten(new)
+    changed = sorted(k for k in after if before.get(k) != after[k])
+    _current = new
+    apply_config(new, changed)
+    return new, changed
+
+
+def restart_required(changed: List[str]) -> List[str]:
+    """Changed keys that only take effect after the application restarts"""
+    return [k for k in changed if k.split(".")[0] in STARTUP_SECTIONS
+            or (k in RESTART_FIELDS and k.startswith("pipeline."))]
+
+
+def apply_config(config: Config, changed: Optional[List[str]] = None):
+    """
+    Push tunables into every loaded backend; models whose build-time settings
+    changed are unloaded and rebuilt on next use
+    """
+    from registry import registry
+
+    for name, section_name in SECTIONS.items():
+        instance = registry.peek(name)
+        if instance is None:
+            continue
+        if changed and any(k in RESTART_FIELDS and k.startswith(section_name + ".") for k in changed):
+            print(f"Reloading {name}: build-time settings changed")
+            registry.unload(name)
+        elif hasattr(instance, "apply_config"):
+            instance.apply_config(getattr(config, section_name))
@@ -0,0 +1,327 @@
+import glob
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'bmp')
+
+
+def _hw_params() -> List[int]:
+    """VideoCapture open params asking for hardware decoding (OpenCV >= 4.5.2, ignored otherwise)"""
+    if not hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        return []
+    return [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+
+class FrameSource:
+    def __init__(self, width: Optional[int] = None, height: Optional[int] = None,
+                 fps: Optional[float] = None):
+        """
+        Anything that produces BGR frames with the cv2.VideoCapture read() signature
+        grab() advances to the next frame cheaply; retrieve() decodes the last grabbed one,
+        so frames nobody looks at are never decoded.
+        :param width: Output width (None keeps the native size)
+        :param height: Output height (None keeps the native size)
+        :param fps: Maximum frame rate (None reads as fast as the source allows)
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._next_due = 0.0
+
+    def isOpened(self) -> bool:
+        return True
+
+    def grab(self) -> bool:
+        raise NotImplementedError
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+    def _pace(self):
+        """Sleep so grab() is not called faster than fps"""
+        if not self.fps:
+            return
+        now = time.monotonic()
+        if self._next_due > now:
+            time.sleep(self._next_due - now)
+        self._next_due = max(self._next_due, now) + 1.0 / self.fps
+
+    def _resize(self, frame: np.ndarray) -> np.ndarray:
+        if not (self.width or self.height):
+            return frame
+        h, w = frame.shape[:2]
+        size = (self.width or round(w * self.height / h), self.height or round(h * self.width / w))
+        return frame if size == (w, h) else cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+class CameraSource(FrameSource):
+    def __init__(self, index=0, width=None, height=None, fps=None, mjpeg=False, hw_decode=False):
+        """
+        Live camera
+        :param index: Device index
+        :param mjpeg: Ask the camera for MJPEG, which allows higher resolutions over USB 2
+        :param hw_decode: Ask OpenCV for hardware-accelerated decoding where the backend supports it
+        """
+        super().__init__(width, height, fps)
+        params = _hw_params() if hw_decode else []
+        self.cap = cv2.VideoCapture(index, cv2.CAP_ANY, params) if params else cv2.VideoCapture(index)
+        if mjpeg:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        # The driver resizes and rate-limits for free; _resize() only fixes what it refused
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # never hand out frames queued in the driver
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def grab(self) -> bool:
+        return self.cap.grab()
+
+    def retrieve(self):
+        with metrics.timer("capture.decode"):
+            ret, frame = self.cap.retrieve()
+        return ret, self._resize(frame) if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path: str, width=None, height=None, fps=None, loop=False, realtime=True,
+                 hw_decode=False):
+        """
+        Recorded video
+        :param loop: Start over at the end instead of reporting end of stream
+        :param realtime: Play at the file's frame rate (or fps), dropping frames when the
+                         consumer is slower, like a camera would; False returns every frame
+        """
+        super().__init__(width, height, fps)
+        params = _hw_params() if hw_decode else []
+        self.path = path
+        self.cap = cv2.VideoCapture(path, cv2.CAP_ANY, params) if params else cv2.VideoCapture(path)
+        self.loop = loop
+        self.realtime = realtime
+        if realtime and not fps:
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self._started = None
+        self._position = 0
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def grab(self) -> bool:
+        if not self.realtime:
+            return self._grab_next()
+        # Skip (grab without decoding) the frames a live camera would have shown meanwhile
+        if self._started is None:
+            self._started = time.monotonic()
+        due = self._due()
+        if self._position > due:
+            time.sleep((self._position - due) / self.fps)
+        grabbed = self._grab_next()
+        while grabbed and self._position <= self._due():
+            grabbed = self._grab_next()
+        return grabbed
+
+    def _due(self) -> int:
+        """Index of the frame a real-time player would show now"""
+        return int((time.monotonic() - self._started) * self.fps)
+
+    def _grab_next(self) -> bool:
+        if self.cap.grab():
+            self._position += 1
+            return True
+        if not self.loop:
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._started, self._position = time.monotonic(), 0
+        if self.cap.grab():
+            self._position = 1
+            return True
+        return False
+
+    def retrieve(self):
+        with metrics.timer("capture.decode"):
+            ret, frame = self.cap.retrieve()
+        return ret, self._resize(frame) if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class FrameListSource(FrameSource):
+    def __init__(self, frames: List[np.ndarray], width=None, height=None, fps=None, loop=False, loops=1):
+        """
+        Replays in-memory frames
+        :param loop: Repeat forever
+        :param loops: Passes over the frames before end of stream (when loop is False)
+        """
+        super().__init__(width, height, fps)
+        self.frames = frames
+        self.loop = loop
+        self.total = len(frames) * loops
+        self.served = 0
+
+    def isOpened(self) -> bool:
+        return bool(self.frames)
+
+    def grab(self) -> bool:
+        if not self.frames or (not self.loop and self.served >= self.total):
+            return False
+        self._pace()
+        self.served += 1
+        return True
+
+    def retrieve(self):
+        return True, self._resize(self.frames[(self.served - 1) % len(self.frames)])
+
+
+class ImageDirectorySource(FrameListSource):
+    def __init__(self, path: str, width=None, height=None, fps=None, loop=True):
+        """Still images in name order, e.g. captures/ (decoded once up front; 1 fps unless fps is given, 0 unpaced)"""
+        paths = sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(path, f"*.{ext}")))
+        frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+        super().__init__(frames, width, height, 1.0 if fps is None else fps, loop)
+        self.path = path
+
+
+class SyntheticSource(FrameSource):
+    def __init__(self, width=640, height=480, fps=None, pattern='moving', frames: Optional[int] = None, seed=0):
+        """
+        Generated frames for load tests without a camera or recordings
+        :param pattern: 'moving' (a box sliding over a gradient), 'static' or 'noise'
+        :param frames: Stop after this many frames (None runs forever)
+        :param fps: Frame rate (default 30, 0 as fast as possible)
+        """
+        super().__init__(width or 640, height or 480, 30.0 if fps is None else fps)
+        self.pattern = pattern
+        self.limit = frames
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+        gradient = np.linspace(0, 255, self.width, dtype=np.uint8)
+        self._background = np.repeat(np.tile(gradient, (self.height, 1))[:, :, None], 3, axis=2)
+
+    def grab(self) -> bool:
+        if self.limit is not None and self.count >= self.limit:
+            return False
+        self._pace()
+        self.count += 1
+        return True
+
+    def retrieve(self):
+        if self.pattern == 'noise':
+            return True, self._rng.integers(0, 256, (self.height, self.width, 3), dtype=np.uint8)
+        frame = self._background.copy()
+        if self.pattern == 'moving':
+            size = self.height // 4
+            x = (self.count * 8) % max(1, self.width - size)
+            cv2.rectangle(frame, (x, self.height // 3), (x + size, self.height // 3 + size), (0, 0, 255), -1)
+        return True, frame
+
+
+class LatestFrameReader:
+    def __init__(self, source: FrameSource):
+        """
+        Keep grabbing in the background so the newest frame is always ready, but decode
+        only when read() is called
+        """
+        self.source = source
+        self._cond = threading.Condition()
+        self._wanted = threading.Event()
+        self._grabbed = 0
+        self._read = 0
+        self._ended = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                # A waiting reader decodes the fresh frame before the next grab replaces it
+                self._cond.wait_for(lambda: not (self._wanted.is_set() and self._grabbed > self._read)
+                                    or self._stop.is_set(), 0.1)
+                ok = self.source.grab()  # grab and retrieve share the capture, so both hold the lock
+                if ok:
+                    self._grabbed += 1
+                else:
+                    self._ended = True
+                self._cond.notify_all()
+            if not ok:
+                break
+
+    def isOpened(self) -> bool:
+        return self.source.isOpened()
+
+    def read(self, timeout=None) -> Tuple[bool, Optional[np.ndarray]]:
+        """Decode the newest grabbed frame, waiting for one newer than the last read"""
+        self._wanted.set()
+        with self._cond:
+            try:
+                if not self._cond.wait_for(lambda: self._grabbed > self._read or self._ended, timeout):
+                    return False, None
+                if self._grabbed == self._read:
+                    return False, None  # source ended
+                self._read = self._grabbed
+                return self.source.retrieve()
+            finally:
+                self._wanted.clear()
+                self._cond.notify_all()
+
+    def release(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        with self._cond:
+            self._ended = True  # wake a reader still waiting for a frame
+            self._cond.notify_all()
+        self.source.release()
+
+
+SOURCES = {
+    'camera': CameraSource,
+    'video': VideoFileSource,
+    'images': ImageDirectorySource,
+    'synthetic': SyntheticSource,
+}
+
+
+def open_source(cfg):
+    """
+    Build the frame source described by the source section of config.py
+    :return: An object with read()/isOpened()/release(); live and real-time sources are
+             wrapped in LatestFrameReader so stale frames are dropped undecoded
+    """
+    if cfg.kind not in SOURCES:
+        raise ValueError(f"Unknown frame source '{cfg.kind}' (choose from {', '.join(SOURCES)})")
+    size = dict(width=cfg.width, height=cfg.height, fps=cfg.fps)
+    if cfg.kind == 'camera':
+        source = CameraSource(int(cfg.path or 0), mjpeg=cfg.mjpeg, hw_decode=cfg.hw_decode, **size)
+    elif cfg.kind == 'video':
+        source = VideoFileSource(cfg.path, loop=cfg.loop, realtime=cfg.realtime, hw_decode=cfg.hw_decode, **size)
+    elif cfg.kind == 'images':
+        source = ImageDirectorySource(cfg.path or 'captures', **size)  # always loops
+    else:
+        source = SyntheticSource(pattern=cfg.path or 'moving', **size)
+
+    live = cfg.kind == 'camera' or (cfg.kind == 'video' and cfg.realtime)
+    return LatestFrameReader(source) if live and cfg.latest_only else source
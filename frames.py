@@ -0,0 +1,38 @@
+import os
+import time
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+# Backends accept either an in-memory BGR frame or a path to an image file
+ImageInput = Union[str, np.ndarray]
+
+
+def load_frame(image: ImageInput) -> Optional[np.ndarray]:
+    """
+    Resolve an image argument to a BGR frame without touching disk for arrays
+    :param image: NumPy BGR frame, or path to an image file (compatibility)
+    :return: The frame, or None if the path could not be read
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    with metrics.timer("frames.decode"):
+        return cv2.imread(image)
+
+
+def describe(image: ImageInput) -> str:
+    """Short label for error messages"""
+    if isinstance(image, np.ndarray):
+        return f"frame {image.shape}"
+    return str(image)
+
+
+def save_debug_capture(frame: np.ndarray, output_dir: str = "captures") -> str:
+    """Write a frame to disk for debugging (only called when explicitly enabled)"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"frame_{int(time.time())}.jpg")
+    cv2.imwrite(path, frame)
+    return path
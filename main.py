@@ -1,75 +1,222 @@
-import cv2
+import importlib
 import sys
-import os
 import time
+from config import config_file_changed, get_config, load_config, reload_config, restart_required
+import metrics
+from registry import registry
+from frames import save_debug_capture
+from frame_sources import open_source
+from pipeline import SKIP, Pipeline
+from scheduler import AdaptiveScheduler
+from warmup import BackgroundLoader
 
-# Configuration
-CAPTURE_DIR = "captures"
-os.makedirs(CAPTURE_DIR, exist_ok=True)
-PROCESS_INTERVAL = 2  # seconds between processing
+# Configuration lives in config.py (file / NAYAN_* environment / --set overrides)
+# Backends each mode needs before it analyses anything (auto mode crops faces and text from YOLO boxes)
+MODE_MODELS = {1: ('reco',), 2: ('face',), 3: ('ocr',), 4: ('reco', 'auto', 'face', 'ocr')}
+MODE_NAMES = {1: "Captioning", 2: "Recognition", 3: "OCR", 4: "Auto"}
+
+def _lazy(module, function, backend=None, method=None):
+    """
+    Import the backend module on first call instead of at startup
+    When the backend runs in a worker process, backend.method is called on its proxy instead,
+    so the module (and torch, easyocr or dlib with it) is never imported into this process
+    """
+    def call(*args, **kwargs):
+        if backend is not None and registry.is_pinned(backend):
+            return getattr(registry.get(backend), method)(*args, **kwargs)
+        return getattr(importlib.import_module(module), function)(*args, **kwargs)
+    return call
 
 def load_models():
-    """Dynamically import model functions"""
+    """Model functions; only speech is imported here, the backends when first used"""
     try:
         from model1.voice import text_to_speech
-        from model2.ocr import perform_ocr
-        from model3.face_detection import recognize_faces
-        from model4.reco import recognize_objects
-        return {
-            'tts': text_to_speech,
-            'ocr': perform_ocr,
-            'face': recognize_faces,
-            'reco': recognize_objects
-        }
     except ImportError as e:
         print(f"Error loading models: {str(e)}")
         sys.exit(1)
+    return {
+        'tts': text_to_speech,
+        'ocr': _lazy('model2.ocr', 'perform_ocr', 'ocr', 'perform_ocr'),
+        'ocr_stream': _lazy('model2.ocr', 'stream_ocr', 'ocr', 'stream_lines'),
+        'face': _lazy('model3.face_detection', 'recognize_faces', 'face', 'recognize_faces'),
+        'face_new': _lazy('model3.face_detection', 'recognize_new_faces', 'face', 'recognize_new_faces'),
+        'reco': _lazy('model4.reco', 'recognize_objects', 'reco', 'recognize_objects'),
+        'reco_changes': _lazy('model4.reco', 'recognize_object_changes', 'reco', 'recognize_changes'),
+        'auto': _lazy('cascade', 'analyse_auto')
+    }
+
+def cache_stats():
+    """Hit/miss counters of the caches of every loaded backend (frame-level and OCR crop-level)"""
+    parts = []
+    for name in registry.loaded():
+        for attr, label in (('result_cache', 'cache'), ('region_cache', 'region cache')):
+            cache = getattr(registry.peek(name), attr, None)
+            s = cache.stats() if cache is not None else None
+            if s and s['hits'] + s['misses']:  # e.g. the OCR page cache is unused while lines stream
+                parts.append(f"{name} {label}: {s['hits']} hits / {s['misses']} misses ({s['hit_rate']:.0%})")
+    return " | ".join(parts)
+
+def analyse(models, mode, frame):
+    """Run the backend for the current mode and build the sentence to speak"""
+    cfg = get_config().pipeline
+    if cfg.debug_capture:
+        save_debug_capture(frame, cfg.capture_dir)
+
+    if mode == 1:
+        # Objects are tracked between frames, so only what changed is announced
+        changes = models['reco_changes'](frame)
+        if changes:
+            return ". ".join(changes)
+    elif mode == 2:
+        # Faces are tracked between frames, so only people who just arrived are announced
+        caption = models['face_new'](frame)
+        if caption:
+            return f"I think this is {', '.join(caption)}"
+    elif mode == 3:
+        return read_aloud(models, frame)
+    elif mode == 4:
+        # Faces and text are only looked for inside the person / text-like boxes YOLO found
+        phrases = models['auto'](frame)
+        if phrases:
+            return ". ".join(phrases)
+    return None
+
+def read_aloud(models, frame):
+    """
+    Stream OCR lines to speech as they are recognised instead of waiting for the whole page
+    Lines already read aloud come back empty, so a page in view is not read again from the top
+    """
+    first, found = True, False
+    for line in models['ocr_stream'](frame, only_new=True):
+        found = True
+        if line:
+            yield f"I read: {line}" if first else line
+            first = False
+    if not found:
+        yield "No text detected"
+
+def speak_result(models, text, streamed):
+    """Results replace each other in the speech queue; lines of a streamed page must not"""
+    if streamed:
+        models['tts'](text, max_age=None)
+    else:
+        models['tts'](text, key='result')
+
+def check_config(scheduler):
+    """Apply an edited config file to the running system without restarting models"""
+    try:
+        cfg, changed = reload_config()
+    except Exception as e:
+        print(f"Config reload error: {str(e)}")
+        return
+    if changed:
+        scheduler.apply_config(cfg.pipeline)
+        if any(key.startswith('metrics.') for key in changed):
+            metrics.configure(cfg.metrics)
+        print(f"Config reloaded: {', '.join(changed)}")
+        later = restart_required(changed)
+        if later:
+            print(f"{', '.join(later)} take effect after a restart")
+
+def prepare_backend(cfg, argv):
+    """Hook run by the background loader between importing a backend and building it"""
+    if not cfg.pipeline.process_backends:
+        return None
+    # Each backend gets its own process; the model functions above then call into its proxy.
+    # All proxies go in before the first build, as auto mode reaches face/OCR through the registry.
+    from workers import use_process_backends
+    installed = []
+
+    def prepare(name):
+        if not installed:
+            use_process_backends(cfg.pipeline, argv)
+            installed.append(True)
+    return prepare
 
-def main():
+def main(argv=None):
+    started = time.monotonic()
+    cfg = load_config(argv)
+    print(f"Using '{cfg.profile}' profile")
+    metrics.configure(cfg.metrics)
     models = load_models()
-    mode = 1  # 1: YOLO, 2: face Recognition, 3: OCR
-    last_processed = 0
-    
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Could not open camera")
+    from model1.voice import PRIORITY_URGENT  # imported by load_models(), which reports a missing engine
+    mode = 1  # 1: YOLO, 2: face Recognition, 3: OCR, 4: Auto
+
+    # Stage 1: speech and camera only, so the device talks within about a second
+    registry.load('tts')
+    source = open_source(cfg.source)  # camera by default; video/images/synthetic run headless
+    if not source.isOpened():
+        print(f"Error: Could not open {cfg.source.kind} source")
         return
-    
-    print("Blind Assistance System Ready")
-    print("Press 1: Captioning, 2: Recognition, 3: OCR, q: Quit")
+    models['tts']("Ready", priority=PRIORITY_URGENT)
+    metrics.metrics.observe("startup.ready", time.monotonic() - started)
+    print(f"Blind Assistance System Ready ({time.monotonic() - started:.1f}s)")
+
+    pipeline = Pipeline(
+        source.read,
+        # Frames arriving before the mode's model is loaded are skipped, never waited on
+        lambda mode, frame: analyse(models, mode, frame) if loader.ready(*MODE_MODELS[mode]) else SKIP,
+        lambda text, streamed: speak_result(models, text, streamed),
+        mode=mode,
+        workers=cfg.pipeline.inference_workers,
+        scheduler=AdaptiveScheduler.from_config(cfg.pipeline),
+        on_demand=cfg.pipeline.capture_on_demand,
+    )
+
+    # Stage 2: the default mode's model, then (optionally) every other one, in the background
+    announce = {mode}  # modes whose "ready" is still owed to the user
+
+    def on_ready(name):
+        current = pipeline.mode
+        if current in announce and name in MODE_MODELS[current] and loader.ready(*MODE_MODELS[current]):
+            announce.discard(current)
+            models['tts'](f"{MODE_NAMES[current]} mode ready", priority=PRIORITY_URGENT)
+
+    def on_failed(name, error):
+        if name in MODE_MODELS[pipeline.mode]:
+            models['tts'](f"{MODE_NAMES[pipeline.mode]} mode is unavailable", priority=PRIORITY_URGENT)
+
+    def ensure_loaded(mode):
+        """Queue the mode's backends that are not loaded (e.g. after a config edit unloaded them)"""
+        missing = [name for name in MODE_MODELS[mode] if not loader.ready(name)]
+        if not missing:
+            return True
+        # Say so and keep going; the mode starts once its models are in
+        announce.add(mode)
+        loader.request(*missing, urgent=True)
+        models['tts'](f"{MODE_NAMES[mode]} mode is loading", priority=PRIORITY_URGENT, preempt=True)
+        return False
+
+    loader = BackgroundLoader(prepare_backend(cfg, sys.argv[1:] if argv is None else argv), on_ready, on_failed)
+    loader.request(*MODE_MODELS[mode])
+    if cfg.pipeline.warm_all_models:
+        loader.request(*(name for name in ('reco', 'face', 'ocr', 'auto') if name not in MODE_MODELS[mode]))
+
+    print("Press 1: Captioning, 2: Recognition, 3: OCR, 4: Auto, q: Quit")
     
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("Error: Could not read frame")
-                break
-            
-            current_time = time.time()
-            
-            # Process frame if interval has elapsed
-            if current_time - last_processed >= PROCESS_INTERVAL:
-                timestamp = int(time.time())
-                img_path = os.path.join(CAPTURE_DIR, f"frame_{timestamp}.jpg")
-                cv2.imwrite(img_path, frame)
-                
-                try:
-                    if mode == 1:
-                        objects = models['reco'](img_path)
-                        if objects:  # Only speak if objects detected
-                            models['tts'](f"I see {', '.join(objects)}")
-                    elif mode == 2:
-                        caption = models['face'](img_path)
-                        if caption:
-                            models['tts'](f"I think this is {caption}")
-                    elif mode == 3:
-                        text = models['ocr'](img_path)
-                        models['tts'](f"I read: {text}" if text else "No text detected")
-                    
-                    last_processed = current_time
-                    os.remove(img_path)
-                except Exception as e:
-                    print(f"Processing error: {str(e)}")
+        pipeline.start()
+        last_stats = last_config_check = time.monotonic()
+        while pipeline.running():
+            cfg = get_config().pipeline
+            if cfg.model_idle_timeout is not None:
+                registry.unload_idle(cfg.model_idle_timeout, keep=('tts', *MODE_MODELS[mode]))
+
+            if cfg.stats_interval and time.monotonic() - last_stats >= cfg.stats_interval:
+                print(pipeline.format_stats())
+                caches = cache_stats()
+                if caches:
+                    print(caches)
+                last_stats = time.monotonic()
+
+            if cfg.config_poll_interval and time.monotonic() - last_config_check >= cfg.config_poll_interval:
+                if config_file_changed():
+                    check_config(pipeline.scheduler)
+                    # Restart-only fields unload the backends they affect; build them again
+                    pending = loader.pending()
+                    if any(not loader.ready(name) and name not in pending for name in MODE_MODELS[mode]):
+                        ensure_loaded(mode)
+                last_config_check = time.monotonic()
             
             # Non-GUI key detection
             if sys.platform == 'win32':
@@ -78,16 +225,35 @@ def main():
                     key = msvcrt.getch().decode()
                     if key == 'q':
                         break
-                    elif key in ('1', '2', '3'):
+                    elif key in ('1', '2', '3', '4'):
                         mode = int(key)
-                        mode_names = {1: "Captioning", 2: "Recognition", 3: "OCR"}
-                        models['tts'](f"{mode_names.get(mode, '')} mode activated")
+                        pipeline.set_mode(mode)
+                        reco, ocr, auto = registry.peek('reco'), registry.peek('ocr'), registry.peek('auto')
+                        if mode == 1 and reco is not None:
+                            reco.reset_tracking()  # describe the whole scene again
+                        elif mode == 3 and ocr is not None:
+                            ocr.reset_reading()  # read the page in view from the top again
+                        elif mode == 4 and auto is not None:
+                            auto.reset()
+                        if ensure_loaded(mode):
+                            models['tts'](f"{MODE_NAMES[mode]} mode activated",
+                                          priority=PRIORITY_URGENT, preempt=True)
             else:
                 # Linux/Mac alternative would go here
                 pass
+
+            time.sleep(0.05)  # the pipeline threads do the work; just poll keys
     
     finally:
-        cap.release()
+        loader.stop()
+        pipeline.stop()
+        print(pipeline.format_stats())
+        if metrics.metrics.enabled:
+            metrics.metrics.export()  # final snapshot
+        metrics.metrics.stop()
+        source.release()
+        for name in registry.loaded():
+            registry.unload(name)  # also stops worker processes and frees their shared memory
 
 if __name__ == "__main__":
     main()
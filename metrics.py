@@ -0,0 +1,277 @@
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS, window=512):
+        """Cumulative latency buckets plus a rolling window for percentiles"""
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = collections.deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        recent = sorted(self._recent)
+        if not recent:
+            return 0.0
+        return recent[min(len(recent) - 1, int(q / 100 * len(recent)))]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class _NullTimer:
+    """Returned by Metrics.timer() while disabled, so a timed block costs one attribute check"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        """
+        Stage timers, counters and latency histograms shared by every module
+        Names are "component.stage", e.g. "reco.inference" or "pipeline.capture"
+        :param enabled: When False every call returns immediately
+        """
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = collections.defaultdict(int)
+        self.exporters: List = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += amount
+
+    def timer(self, name: str):
+        """Context manager timing a block into the named histogram"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_timings(self, component: str, timings: Dict[str, float]):
+        """Feed a {stage: seconds} dict (e.g. FaceRecognizer.last_timings) into histograms"""
+        if not self.enabled:
+            return
+        for stage, seconds in timings.items():
+            self.observe(f"{component}.{stage}", seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_s": time.time() - self.started,
+                "stages": {name: h.snapshot() for name, h in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        return exporter
+
+    def export(self):
+        """Push one snapshot to every exporter"""
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception as e:
+                print(f"Metrics export error ({type(exporter).__name__}): {str(e)}")
+
+    def start(self, interval=30.0):
+        """Export every interval seconds from a background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        def run():
+            while not self._stop.wait(interval):
+                if self.enabled:
+                    self.export()
+        self._thread = threading.Thread(target=run, name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        for exporter in self.exporters:
+            close = getattr(exporter, "close", None)
+            if close is not None:
+                close()
+        self.exporters = []
+
+
+class LogExporter:
+    def __init__(self, stages=None):
+        """
+        One summary line per export
+        :param stages: Histogram names to include (default: all)
+        """
+        self.stages = stages
+
+    def format(self, snapshot: Dict) -> str:
+        parts = [f"{name} p50 {s['p50_ms']:.0f}ms p95 {s['p95_ms']:.0f}ms (n={s['count']})"
+                 for name, s in snapshot["stages"].items()
+                 if self.stages is None or name in self.stages]
+        parts += [f"{name}={value}" for name, value in snapshot["counters"].items()]
+        return "metrics | " + " | ".join(parts)
+
+    def export(self, snapshot: Dict):
+        print(self.format(snapshot))
+
+
+class JSONFileExporter:
+    def __init__(self, path: str):
+        """Overwrite a JSON file with the latest snapshot (atomic replace, safe to tail/poll)"""
+        self.path = path
+
+    def export(self, snapshot: Dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _split(name: str):
+    component, _, stage = name.partition(".")
+    return (component, stage) if stage else ("app", component)
+
+
+def prometheus_text(metrics: Metrics, prefix="nayan") -> str:
+    """Prometheus text exposition format of the current histograms and counters"""
+    lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+    with metrics._lock:
+        histograms = sorted(metrics.histograms.items())
+        counters = sorted(metrics.counters.items())
+        for name, h in histograms:
+            component, stage = _split(name)
+            labels = f'component="{component}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(h.buckets + (float("inf"),), h.bucket_counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {h.total:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {h.count}")
+    lines.append(f"# TYPE {prefix}_events_total counter")
+    for name, value in counters:
+        component, event = _split(name)
+        lines.append(f'{prefix}_events_total{{component="{component}",event="{event}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    def __init__(self, metrics: Metrics, port=9108, host="127.0.0.1"):
+        """Serve GET /metrics on a local port; scrapes read live values, export() is a no-op"""
+        source = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = prometheus_text(source).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # keep the console for speech output
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        print(f"Metrics at http://{host}:{self.port}/metrics")
+
+    def export(self, snapshot: Dict):
+        pass
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Shared by every backend module and main.py
+metrics = Metrics()
+
+
+def configure(cfg) -> Metrics:
+    """Set up the shared instance from the metrics section of config.py"""
+    metrics.stop()
+    metrics.enabled = cfg.enabled
+    if not cfg.enabled:
+        return metrics
+    if cfg.log:
+        metrics.add_exporter(LogExporter())
+    if cfg.json_path:
+        metrics.add_exporter(JSONFileExporter(cfg.json_path))
+    if cfg.prometheus_port is not None:
+        metrics.add_exporter(PrometheusExporter(metrics, cfg.prometheus_port))
+    metrics.start(cfg.export_interval)
+    return metrics
@@ -0,0 +1,327 @@
+import glob
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import wave
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from metrics import metrics
+
+# YOLOv8 (COCO) class names, as reco announces them
+COCO_CLASSES = (
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
+    "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog",
+    "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella",
+    "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite",
+    "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle",
+    "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange",
+    "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant",
+    "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
+    "teddy bear", "hair drier", "toothbrush",
+)
+
+# Fixed announcements and the fragments results are built from (see main.py, tracker, face labels)
+PHRASES = (
+    "Captioning mode activated", "Recognition mode activated", "OCR mode activated",
+    "Auto mode activated", "No text detected", "Unknown person", "I'm not sure, but this might be",
+    "I see", "New", "Gone", "Now close", "I think this is", "I read", "The", "reads",
+)
+
+MAX_FRAGMENT_WORDS = 6  # longest span looked up when composing, and longest miss worth caching
+PAUSES = {",": 0.15, ":": 0.15, ";": 0.2, ".": 0.3}  # silence after a fragment ending in these
+_PUNCTUATION = ".,:;!?\"'"
+
+# Same rule as model3.gallery.identity_from_filename, without importing dlib
+_EXTRA_PHOTO_SUFFIX = re.compile(r"^(.+?)_\d+$")
+
+
+def normalise(text: str) -> str:
+    """Lookup form of a phrase: lower case, no surrounding punctuation, single spaces"""
+    words = (w.strip(_PUNCTUATION).lower() for w in text.split())
+    return " ".join(w for w in words if w)
+
+
+def enrolled_names(images_dir: str) -> List[str]:
+    names = []
+    for path in glob.glob(os.path.join(images_dir, "*")):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        match = _EXTRA_PHOTO_SUFFIX.match(stem)
+        names.append(match.group(1) if match else stem)
+    return sorted(set(names))
+
+
+def default_vocabulary(extra: Iterable[str] = (), images_dir: Optional[str] = None) -> List[str]:
+    """Phrases worth rendering ahead of time: announcements, counts, class names and enrolled names"""
+    if images_dir is None:
+        images_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model3", "images")
+    phrases = list(PHRASES) + [str(n) for n in range(1, 11)]
+    for name in COCO_CLASSES:
+        phrases += [name, f"{name}s"]  # Detections.to_phrases pluralises with a plain "s"
+    phrases += enrolled_names(images_dir)
+    phrases += list(extra)
+    return list(dict.fromkeys(phrases))
+
+
+class ClipPlayer:
+    def __init__(self):
+        """
+        Plays WAV audio with the lowest-latency player available: simpleaudio if installed,
+        winsound on Windows, otherwise aplay / paplay / afplay
+        """
+        try:
+            import simpleaudio
+            self._simpleaudio = simpleaudio
+        except ImportError:
+            self._simpleaudio = None
+        self._command = None
+        if self._simpleaudio is None and sys.platform != 'win32':
+            for command in (['aplay', '-q'], ['paplay'], ['afplay']):
+                if shutil.which(command[0]):
+                    self._command = command
+                    break
+
+    @property
+    def available(self) -> bool:
+        return self._simpleaudio is not None or sys.platform == 'win32' or self._command is not None
+
+    def play(self, params, frames: bytes, path: str, interrupt: threading.Event):
+        """
+        Play PCM frames and return when done or when interrupt is set
+        :param params: wave params of the frames
+        :param path: Scratch WAV file for players that need one
+        """
+        if self._simpleaudio is not None:
+            playing = self._simpleaudio.play_buffer(frames, params.nchannels, params.sampwidth, params.framerate)
+            while playing.is_playing():
+                if interrupt.wait(0.02):
+                    playing.stop()
+            return
+
+        with wave.open(path, 'wb') as out:
+            out.setparams(params)
+            out.writeframes(frames)
+        if sys.platform == 'win32':
+            import winsound
+            winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_ASYNC)
+            duration = len(frames) / (params.nchannels * params.sampwidth * params.framerate)
+            if interrupt.wait(duration):
+                winsound.PlaySound(None, 0)
+            return
+
+        process = subprocess.Popen([*self._command, path])
+        while process.poll() is None:
+            if interrupt.wait(0.02):
+                process.terminate()
+                process.wait()
+
+
+class PhraseCache:
+    def __init__(self, cache_dir: str, max_mb=50.0, compose=True, player: Optional[ClipPlayer] = None):
+        """
+        Pre-rendered speech clips, keyed on normalised text, rate, volume and voice
+        A sentence is played from one clip when it was rendered as a whole, otherwise from
+        consecutive fragment clips when every word is covered; anything else is left to live
+        synthesis. Clips are least-recently-used evicted above max_mb, with file mtimes as the
+        recency record so the order survives restarts.
+        :param cache_dir: Directory holding the WAV clips
+        :param max_mb: Size cap of the directory
+        :param compose: Build sentences from fragment clips
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.compose = compose
+        self.player = player or ClipPlayer()
+        self._lock = threading.Lock()
+        self._clips: "OrderedDict[str, int]" = OrderedDict()  # clip file -> size, least recent first
+        self._pending: "OrderedDict[str, Tuple[str, int, float, Optional[int]]]" = OrderedDict()
+        self._scratch = os.path.join(cache_dir, "_playback.wav")
+
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = [e for e in os.scandir(cache_dir) if e.name.endswith(".wav") and not e.name.startswith("_")]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._clips[entry.name] = entry.stat().st_size
+
+    @classmethod
+    def from_config(cls, cfg) -> 'PhraseCache':
+        return cls(cfg.cache_dir, cfg.cache_max_mb, cfg.cache_compose)
+
+    def apply_config(self, cfg):
+        self.compose = cfg.cache_compose
+        self.max_bytes = int(cfg.cache_max_mb * 1024 * 1024)
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def clip_name(text: str, rate: int, volume: float, voice_id: Optional[int]) -> str:
+        key = f"{normalise(text)}|{rate}|{volume:.2f}|{voice_id}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".wav"
+
+    def size_bytes(self) -> int:
+        return sum(self._clips.values())
+
+    def __len__(self):
+        return len(self._clips)
+
+    def queue(self, phrases: Iterable[str], rate: int, volume: float, voice_id: Optional[int] = None) -> int:
+        """
+        Schedule phrases for rendering (see render_next)
+        :return: Number of phrases that were not cached or queued yet
+        """
+        added = 0
+        with self._lock:
+            for text in phrases:
+                name = self.clip_name(text, rate, volume, voice_id)
+                if normalise(text) and name not in self._clips and name not in self._pending:
+                    self._pending[name] = (text, rate, volume, voice_id)
+                    added += 1
+        return added
+
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def render_next(self, tts) -> bool:
+        """Render one queued phrase with the given TextToSpeech (call from the thread that owns it)"""
+        with self._lock:
+            if not self._pending:
+                return False
+            name, (text, rate, volume, voice_id) = self._pending.popitem(last=False)
+        return self.render(tts, text, rate, volume, voice_id, name)
+
+    def render(self, tts, text: str, rate: int, volume: float, voice_id: Optional[int] = None,
+               name: Optional[str] = None) -> bool:
+        name = name or self.clip_name(text, rate, volume, voice_id)
+        path = os.path.join(self.cache_dir, name)
+        scratch = os.path.join(self.cache_dir, f"_render_{name}")
+        try:
+            tts.save_to_file(text, scratch, rate=rate, volume=volume, voice_id=voice_id, verbose=False)
+            with wave.open(scratch, 'rb') as clip:  # some drivers write AIFF; those cannot be composed
+                if not clip.getnframes():
+                    raise wave.Error("empty clip")
+            os.replace(scratch, path)
+        except (OSError, EOFError, wave.Error) as e:
+            print(f"Phrase cache: could not render '{text}': {str(e)}")
+            if os.path.exists(scratch):
+                os.remove(scratch)
+            return False
+        metrics.inc("tts.cache_rendered")
+        with self._lock:
+            self._clips[name] = os.path.getsize(path)
+            self._clips.move_to_end(name)
+            self._evict()
+        return True
+
+    def _evict(self):
+        total = self.size_bytes()
+        while total > self.max_bytes and len(self._clips) > 1:
+            name, size = self._clips.popitem(last=False)
+            total -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            metrics.inc("tts.cache_evicted")
+
+    def plan(self, text: str, rate: int, volume: float, voice_id: Optional[int] = None) -> Optional[List[Tuple[str, float]]]:
+        """
+        Clips that together say text
+        :return: [(clip file, pause after in seconds)], or None if some words are not cached
+        """
+        whole = self.clip_name(text, rate, volume, voice_id)
+        if whole in self._clips:
+            return [(whole, 0.0)]
+        if not self.compose:
+            return None
+
+        words = text.split()
+        plan, i = [], 0
+        while i < len(words):
+            # Longest cached span starting at word i
+            for j in range(min(len(words), i + MAX_FRAGMENT_WORDS), i, -1):
+                name = self.clip_name(" ".join(words[i:j]), rate, volume, voice_id)
+                if name in self._clips:
+                    break
+            else:
+                if not normalise(words[i]):
+                    i += 1  # stray punctuation
+                    continue
+                return None
+            plan.append((name, PAUSES.get(words[j - 1][-1], 0.0)))
+            i = j
+        return plan or None
+
+    def _load(self, plan: List[Tuple[str, float]]):
+        """Concatenate the clips of a plan; None if they are unreadable or in different formats"""
+        params, chunks = None, []
+        for name, pause in plan:
+            try:
+                with wave.open(os.path.join(self.cache_dir, name), 'rb') as clip:
+                    clip_params = clip.getparams()
+                    frames = clip.readframes(clip.getnframes())
+            except (OSError, EOFError, wave.Error):
+                with self._lock:
+                    self._clips.pop(name, None)  # removed or corrupt; rendered again if needed
+                return None
+            if params is None:
+                params = clip_params
+            elif clip_params[:3] != params[:3]:  # channels, sample width, rate
+                return None
+            chunks.append(frames)
+            if pause:
+                chunks.append(b"\x00" * (int(pause * params.framerate) * params.nchannels * params.sampwidth))
+        return params, b"".join(chunks)
+
+    def play(self, text: str, rate: int, volume: float, voice_id: Optional[int],
+             interrupt: threading.Event) -> bool:
+        """
+        Speak text from cached clips
+        :return: False if it has to be synthesised live; short misses are queued for rendering
+        """
+        plan = self.plan(text, rate, volume, voice_id)
+        loaded = self._load(plan) if plan else None
+        if loaded is None:
+            metrics.inc("tts.cache_misses")
+            if len(text.split()) <= MAX_FRAGMENT_WORDS:
+                self.queue([text], rate, volume, voice_id)  # fixed short phrases recur
+            return False
+
+        metrics.inc("tts.cache_hits" if len(plan) == 1 else "tts.cache_composed")
+        with self._lock:
+            for name, _ in plan:
+                if name in self._clips:
+                    self._clips.move_to_end(name)
+        for name, _ in plan:
+            try:
+                os.utime(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        self.player.play(*loaded, self._scratch, interrupt)
+        return True
+
+
+# Install-time rendering: python -m model1.phrase_cache [--profile ...] [--set speech.rate=170]
+if __name__ == "__main__":
+    from config import load_config
+    from model1.voice import TextToSpeech
+
+    speech = load_config(sys.argv[1:]).speech
+    cache = PhraseCache.from_config(speech)
+    count = cache.queue(default_vocabulary(speech.cache_vocabulary), speech.rate, speech.volume)
+    tts = TextToSpeech()
+    rendered = failed = 0
+    while cache.has_pending():  # render_next() is also False for a failed phrase; keep going
+        if cache.render_next(tts):
+            rendered += 1
+        else:
+            failed += 1
+    tts.close()
+    print(f"Rendered {rendered} of {count} new phrases; {len(cache)} clips, "
+          f"{cache.size_bytes() / 1024 / 1024:.1f} MB in {cache.cache_dir}")
+    if failed:
+        print(f"{failed} phrase{'s' if failed > 1 else ''} could not be rendered (see the errors above); "
+              f"the engine speaks them until a later run renders them")
@@ -1,12 +1,31 @@
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
 import pyttsx3
+from config import get_config
+from metrics import metrics
+from model1.phrase_cache import PhraseCache, default_vocabulary
+from registry import registry
+
+# Lower value = more important
+PRIORITY_URGENT = 0   # mode changes, warnings
+PRIORITY_NORMAL = 1   # detection / OCR results
+PRIORITY_LOW = 2      # chatter that may be dropped
+
+_IDLE = object()  # returned by AsyncSpeaker._next when there is nothing to say but clips to render
 
 class TextToSpeech:
-    def __init__(self):
-        """Initialize the text-to-speech engine with default settings"""
+    def __init__(self, rate=None, volume=None):
+        """Initialize the text-to-speech engine with the configured rate and volume"""
+        cfg = get_config().speech
         self.engine = pyttsx3.init()
         # Set default properties
-        self.engine.setProperty('rate', 150)  # Moderate speech rate
-        self.engine.setProperty('volume', 0.9)  # Slightly below max volume
+        self.engine.setProperty('rate', cfg.rate if rate is None else rate)
+        self.engine.setProperty('volume', cfg.volume if volume is None else volume)
         
     def text_to_speech(self, text, rate=None, volume=None, voice_id=None):
         """
@@ -16,7 +35,14 @@ class TextToSpeech:
         :param volume: Optional volume level (0.0 to 1.0)
         :param voice_id: Optional voice ID to use
         """
-        # Apply properties if provided
+        self._apply_properties(rate, volume, voice_id)
+
+        # Speak the text
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+    def _apply_properties(self, rate=None, volume=None, voice_id=None):
+        """Apply properties if provided"""
         if rate is not None:
             self.engine.setProperty('rate', rate)
         if volume is not None:
@@ -27,26 +53,234 @@ class TextToSpeech:
                 self.engine.setProperty('voice', voices[voice_id].id)
             except IndexError:
                 print(f"Voice ID {voice_id} not found. Using default voice.")
-        
-        # Speak the text
-        self.engine.say(text)
-        self.engine.runAndWait()
-        
-    def save_to_file(self, text, filename):
-        """Save the speech to an audio file (optional functionality)"""
+
+    def save_to_file(self, text, filename, rate=None, volume=None, voice_id=None, verbose=True):
+        """Save the speech to an audio file (used by the phrase cache)"""
+        self._apply_properties(rate, volume, voice_id)
         self.engine.save_to_file(text, filename)
         self.engine.runAndWait()
-        print(f"Audio saved to {filename}")
+        if verbose:
+            print(f"Audio saved to {filename}")
+
+    def close(self):
+        """Release the speech engine"""
+        self.engine.stop()
+
+@dataclass(order=True)
+class Utterance:
+    priority: int
+    seq: int
+    text: str = field(compare=False)
+    created: float = field(compare=False)
+    max_age: Optional[float] = field(compare=False, default=None)
+    key: Optional[str] = field(compare=False, default=None)
+    rate: Optional[int] = field(compare=False, default=None)
+    volume: Optional[float] = field(compare=False, default=None)
+    voice_id: Optional[int] = field(compare=False, default=None)
+
+    def is_stale(self, now: float) -> bool:
+        return self.max_age is not None and now - self.created > self.max_age
+
+
+class AsyncSpeaker:
+    def __init__(self, max_age=None, coalesce_window=None):
+        """
+        Speak from a dedicated worker thread so callers never block
+        :param max_age: Default seconds after which a queued result is dropped unspoken
+        :param coalesce_window: Seconds during which an identical announcement is skipped
+        """
+        self._cache: Optional[PhraseCache] = None  # built by the worker, next to its engine
+        self.apply_config(get_config().speech)
+        if max_age is not None:
+            self.max_age = max_age
+        if coalesce_window is not None:
+            self.coalesce_window = coalesce_window
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._current: Optional[Utterance] = None
+        self._interrupt = threading.Event()
+        self._last_text = None
+        self._last_time = 0.0
+        self._running = True
+        self._ready = threading.Event()
+        self._error: Optional[Exception] = None  # set by the worker if the engine cannot start
+
+        # pyttsx3 engines are not thread-safe, so the worker builds and owns its own
+        self._thread = threading.Thread(target=self._run, name="speech", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def say(self, text, priority=PRIORITY_NORMAL, preempt=False, max_age=-1, key=None,
+            rate=None, volume=None, voice_id=None) -> bool:
+        """
+        Queue text for speech and return immediately
+        :param text: Text to be spoken
+        :param priority: PRIORITY_URGENT, PRIORITY_NORMAL or PRIORITY_LOW
+        :param preempt: Cut off the current utterance and drop queued ones of equal or lower priority
+        :param max_age: Seconds before the utterance goes stale (-1 uses the default, None never)
+        :param key: Pending utterances with the same key are replaced by this one
+        :return: False if the text was coalesced with an identical announcement
+        """
+        now = time.monotonic()
+        with self._cond:
+            # Coalesce identical consecutive announcements
+            if text == self._last_text and now - self._last_time < self.coalesce_window:
+                metrics.inc("tts.coalesced")
+                return False
+            if any(u.text == text for u in self._queue):
+                metrics.inc("tts.coalesced")
+                return False
+
+            if preempt:
+                self._queue = [u for u in self._queue if u.priority < priority]
+                if self._current is not None and self._current.priority >= priority:
+                    self._interrupt.set()
+            elif key is not None:
+                self._queue = [u for u in self._queue if u.key != key]
+            heapq.heapify(self._queue)
+
+            heapq.heappush(self._queue, Utterance(
+                priority, next(self._seq), text, now,
+                self.max_age if max_age == -1 else max_age, key, rate, volume, voice_id
+            ))
+            self._last_text = text
+            self._last_time = now
+            self._cond.notify()
+        return True
+
+    def apply_config(self, cfg):
+        """Take new speech settings; rate and volume apply from the next utterance"""
+        self.max_age = cfg.max_age
+        self.coalesce_window = cfg.coalesce_window
+        self.rate = cfg.rate
+        self.volume = cfg.volume
+        if self._cache is not None:
+            self._cache.apply_config(cfg)
+            # Clips are keyed on rate and volume, so new settings need their own renders
+            self._cache.queue(default_vocabulary(cfg.cache_vocabulary), self.rate, self.volume)
+            with self._cond:
+                self._cond.notify()
+
+    def clear(self, interrupt=True):
+        """Drop everything queued and optionally cut off the current utterance"""
+        with self._cond:
+            self._queue = []
+            if interrupt and self._current is not None:
+                self._interrupt.set()
+
+    def is_speaking(self) -> bool:
+        return self._current is not None
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def wait_until_idle(self, timeout=None) -> bool:
+        """Block until the queue is drained (used by demos and shutdown)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._current is not None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """Stop the worker thread and release the engine"""
+        with self._cond:
+            self._running = False
+            self._queue = []
+            if self._current is not None:
+                self._interrupt.set()
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+
+    def _next(self) -> Optional[Utterance]:
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                while self._queue:
+                    utterance = heapq.heappop(self._queue)
+                    if not utterance.is_stale(now):
+                        self._current = utterance
+                        self._interrupt.clear()
+                        return utterance
+                    metrics.inc("tts.expired")
+                self._cond.notify_all()  # wake wait_until_idle()
+                if self._cache is not None and self._cache.has_pending():
+                    return _IDLE
+                self._cond.wait()
+        return None
+
+    def _on_word(self, name, location, length):
+        # Runs inside runAndWait() on the worker thread, where stop() is safe
+        if self._interrupt.is_set():
+            self._tts.engine.stop()
+
+    def _run(self):
+        try:
+            self._tts = TextToSpeech(self.rate, self.volume)
+            self._tts.engine.connect('started-word', self._on_word)
+        except Exception as e:  # e.g. no audio driver; __init__ re-raises it to the caller
+            self._error = e
+            self._ready.set()
+            return
+
+        cfg = get_config().speech
+        if cfg.cache_enabled:
+            try:
+                cache = PhraseCache.from_config(cfg)
+                if cache.player.available:
+                    # Rendered one phrase at a time whenever there is nothing to say
+                    cache.queue(default_vocabulary(cfg.cache_vocabulary), self.rate, self.volume)
+                    self._cache = cache
+                else:
+                    print("Phrase cache disabled: no audio player found (install simpleaudio)")
+            except Exception as e:
+                print(f"Phrase cache disabled: {str(e)}")
+        self._ready.set()
+
+        while True:
+            utterance = self._next()
+            if utterance is None:
+                break
+            if utterance is _IDLE:
+                self._cache.render_next(self._tts)
+                continue
+            start = time.perf_counter()
+            rate = self.rate if utterance.rate is None else utterance.rate
+            volume = self.volume if utterance.volume is None else utterance.volume
+            try:
+                # The engine belongs to this thread, so settings are passed per utterance
+                if self._cache is None or not self._cache.play(utterance.text, rate, volume,
+                                                               utterance.voice_id, self._interrupt):
+                    self._tts.text_to_speech(utterance.text, rate, volume, utterance.voice_id)
+                metrics.inc("tts.interrupted" if self._interrupt.is_set() else "tts.spoken")
+            except Exception as e:
+                print(f"Speech error: {str(e)}")
+            finally:
+                metrics.observe("tts.speech", time.perf_counter() - start)
+                with self._cond:
+                    self._current = None
+                    self._cond.notify_all()
+
+        self._tts.close()
+
+registry.register('tts', AsyncSpeaker, on_unload=AsyncSpeaker.close)
 
 # The following function is what will be imported by the main application
-def text_to_speech(text, rate=None, volume=None, voice_id=None):
+def text_to_speech(text, rate=None, volume=None, voice_id=None,
+                   priority=PRIORITY_NORMAL, preempt=False, key=None, max_age=-1):
     """
     Standalone function that matches the expected interface
-    This creates a TextToSpeech instance and uses it to speak the text
+    Queues the text on the shared AsyncSpeaker and returns without waiting
     """
-    tts = TextToSpeech()
     print(text)
-    tts.text_to_speech(text, rate, volume, voice_id)
+    registry.get('tts').say(text, priority=priority, preempt=preempt, max_age=max_age, key=key,
+                            rate=rate, volume=volume, voice_id=voice_id)
 
 # Example usage
 if __name__ == "__main__":
@@ -55,6 +289,12 @@ if __name__ == "__main__":
     
     # Demonstrate with parameters
     text_to_speech("This is a faster speech", rate=200)
+
+    # Demonstrate preemption: the mode change cuts off the long sentence
+    text_to_speech("I see 2 chairs, 1 table, 3 cups and a very long list of other things")
+    time.sleep(1)
+    text_to_speech("Captioning mode activated", priority=PRIORITY_URGENT, preempt=True)
+    registry.get('tts').wait_until_idle()
     
     # Demonstrate the class directly
     tts = TextToSpeech()
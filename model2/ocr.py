@@ -2,70 +2,413 @@ import easyocr
 import cv2
 import sys
 import os
-from time import time
+import threading
+import numpy as np
+from dataclasses import dataclass
+from time import monotonic
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import get_config
+from metrics import metrics
+from registry import registry
+from frames import describe, load_frame
+from result_cache import ResultCache, cached_by_frame
+
+@dataclass
+class TextRegion:
+    """One detected text box and what was read from it"""
+    box: Tuple[int, int, int, int]  # (x_min, y_min, x_max, y_max) bounding rectangle
+    raw: list                       # box in EasyOCR's format (horizontal or free-form)
+    free: bool = False              # True for rotated boxes
+    text: str = ""
+    confidence: float = 0.0
+    key: Optional[int] = None       # crop hash used by the region cache
+    lang: str = ""                  # recogniser chosen for this crop
+
+def group_lines(regions: List[TextRegion], overlap=0.5) -> List[List[TextRegion]]:
+    """
+    Reading order: top-to-bottom lines, left-to-right within a line
+    :param overlap: Fraction of the smaller box height two boxes must share to be on one line
+    """
+    lines: List[List[TextRegion]] = []
+    for region in sorted(regions, key=lambda r: (r.box[1] + r.box[3]) / 2):
+        x0, y0, x1, y1 = region.box
+        if lines:
+            _, ly0, _, ly1 = lines[-1][0].box
+            shared = min(y1, ly1) - max(y0, ly0)
+            if shared >= overlap * min(y1 - y0, ly1 - ly0):
+                lines[-1].append(region)
+                continue
+        lines.append([region])
+    return [sorted(line, key=lambda r: r.box[0]) for line in lines]
+
+# Shared by every process on the device; OCRProcessor uses ocr.model_dir from config.py
+OCR_MODEL_DIR = os.path.join('model2', 'model_cache')
+
+def looks_devanagari(crop, min_headline=0.55, contrast=2.5) -> bool:
+    """
+    Cheap script check: Devanagari words hang from a continuous headline (shirorekha),
+    which shows up as one very dark row in the upper half of the crop
+    """
+    if crop.shape[0] < 8 or crop.shape[1] < 8:
+        return False
+    _, ink = cv2.threshold(crop, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if ink.mean() > 0.5:
+        ink = 1 - ink  # light text on a dark background
+    rows = ink.mean(axis=1)
+    h = len(rows)
+    headline = rows[h // 10: h // 2 + 1].max()
+    return headline >= min_headline and headline >= contrast * max(float(np.median(rows)), 1e-3)
+
+class RecognizerPool:
+    def __init__(self, languages=('en', 'hi'), model_dir=OCR_MODEL_DIR, idle_timeout=300.0,
+                 check_interval=10.0):
+        """
+        One EasyOCR reader per language, loaded on first need
+        Only the primary (first) language loads the text detector; the others are
+        recognition-only and are evicted after idle_timeout seconds without use.
+        :param check_interval: Seconds between idle checks (they run even while OCR is not used)
+        """
+        self.languages = list(languages)
+        self.primary = self.languages[0]
+        self.model_dir = model_dir
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._readers: Dict[str, easyocr.Reader] = {}
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ocr-evictor", daemon=True)
+        self._thread.start()
+
+    def get(self, lang: Optional[str] = None) -> easyocr.Reader:
+        lang = lang or self.primary
+        with self._lock:
+            reader = self._readers.get(lang)
+            if reader is None:
+                reader = easyocr.Reader(
+                    lang_list=[lang] if lang == 'en' else [lang, 'en'],
+                    gpu=False,
+                    quantize=True,
+                    model_storage_directory=self.model_dir,
+                    download_enabled=True,
+                    detector=lang == self.primary,
+                    recognizer=True,
+                    verbose=False
+                )
+                self._readers[lang] = reader
+            self._last_used[lang] = monotonic()
+            return reader
+
+    def evict_idle(self) -> List[str]:
+        """Drop secondary readers that have not been used for idle_timeout seconds"""
+        now = monotonic()
+        with self._lock:
+            idle = [lang for lang, last in self._last_used.items()
+                    if lang != self.primary and now - last >= self.idle_timeout]
+            for lang in idle:
+                del self._readers[lang]
+                del self._last_used[lang]
+        return idle
+
+    def loaded(self) -> List[str]:
+        return list(self._readers)
+
+    def close(self):
+        """Stop the idle checks"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            for lang in self.evict_idle():
+                print(f"OCR: unloaded idle '{lang}' recogniser")
 
 class OCRProcessor:
     def __init__(self):
         """Initialize the OCR reader with optimized settings"""
-        self.reader = easyocr.Reader(
-            lang_list=['en', 'hi'],
-            gpu=False,
-            quantize=True,
-            model_storage_directory=os.path.join('model2', 'model_cache'),
-            download_enabled=True,
-            detector=True,
-            recognizer=True,
-            verbose=False
-        )
+        cfg = get_config().ocr
+        # Only the primary language loads now; Hindi loads the first time Devanagari is seen
+        self.languages = list(cfg.languages)
+        self.recognizers = RecognizerPool(self.languages, cfg.model_dir, cfg.idle_timeout)
+        self.reader = self.recognizers.get()
+        # Text needs a finer hash than scenes: 16x16 dHash, 256 bits
+        self.result_cache = ResultCache(ttl=30.0, max_distance=8, hash_size=16)
+
+        # Staged OCR: detect boxes, recognise only crops not seen recently
+        self.region_cache = ResultCache(max_entries=512, ttl=300.0, max_distance=6, hash_size=16)
+        self.regions_recognized = 0
+        self.regions_reused = 0
+        # Crops already read aloud, so re-analysing a static page does not read it again
+        self.spoken_regions = ResultCache(max_entries=512, ttl=cfg.repeat_after, max_distance=6, hash_size=16)
+        self.apply_config(cfg)
+
+    def apply_config(self, cfg):
+        """Take new decoding settings; loaded readers are kept (languages/model_dir need a rebuild)"""
+        self.auto_script = cfg.auto_script  # route each crop to a recogniser by script
+        self.target_width = cfg.target_width
+        self.decoder = cfg.decoder
+        self.beam_width = cfg.beam_width
+        self.beam_threshold = cfg.beam_threshold  # crops read below this confidence are retried with beam search
+        self.batch_size = cfg.batch_size
+        self.recognizers.idle_timeout = cfg.idle_timeout
+        self.spoken_regions.ttl = cfg.repeat_after
+        self.result_cache.clear()
     
-    def preprocess_image(self, img_path, target_width=1280):
-        """Optimized image loading with smart resizing"""
-        img = cv2.imread(img_path)
+    def preprocess_image(self, image, target_width=None):
+        """Optimized image loading with smart resizing (BGR frame or path)"""
+        target_width = target_width or self.target_width
+        img = load_frame(image)
         if img is None:
-            raise ValueError(f"Could not read image at {img_path}")
-        
-        # Calculate resize ratio maintaining aspect ratio
-        h, w = img.shape[:2]
-        if w > target_width:
-            ratio = target_width / w
-            img = cv2.resize(img, (target_width, int(h * ratio)))
+            raise ValueError(f"Could not read image at {describe(image)}")
         
-        # Convert to grayscale if color isn't needed
-        if len(img.shape) == 3 and img.shape[2] == 3:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with metrics.timer("ocr.preprocess"):
+            # Calculate resize ratio maintaining aspect ratio
+            h, w = img.shape[:2]
+            if w > target_width:
+                ratio = target_width / w
+                img = cv2.resize(img, (target_width, int(h * ratio)))
+            
+            # Convert to grayscale if color isn't needed
+            if len(img.shape) == 3 and img.shape[2] == 3:
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         return img
     
-    def perform_ocr(self, image_path):
-        """Ultra-optimized OCR pipeline"""
-        try:
-            # Preprocess image
-            img = self.preprocess_image(image_path)
-            
-            # Run detection with current version's API
-            results = self.reader.readtext(
+    def detect_regions(self, img) -> List[TextRegion]:
+        """Run only the text detector (no recognition) on a preprocessed image"""
+        with metrics.timer("ocr.detect"):
+            horizontal, free = self.reader.detect(img)
+        regions = []
+        for x_min, x_max, y_min, y_max in horizontal[0]:
+            box = (max(0, int(x_min)), max(0, int(y_min)), int(x_max), int(y_max))
+            regions.append(TextRegion(box, [x_min, x_max, y_min, y_max]))
+        for points in free[0]:
+            xs, ys = [p[0] for p in points], [p[1] for p in points]
+            box = (max(0, int(min(xs))), max(0, int(min(ys))), int(max(xs)), int(max(ys)))
+            regions.append(TextRegion(box, points, free=True))
+        return regions
+
+    def _script_of(self, crop) -> str:
+        if self.auto_script and 'hi' in self.languages and looks_devanagari(crop):
+            return 'hi'
+        return self.recognizers.primary
+
+    def _recognize(self, img, regions: List[TextRegion], decoder: str, reader=None):
+        """Recognise several crops in one batched call and write the text back to each region"""
+        with metrics.timer(f"ocr.recognize_{decoder}"):
+            results = (reader or self.reader).recognize(
                 img,
-                decoder='beamsearch',
-                beamWidth=3,
-                batch_size=4,
+                horizontal_list=[r.raw for r in regions if not r.free],
+                free_list=[r.raw for r in regions if r.free],
+                decoder=decoder,
+                beamWidth=self.beam_width,
+                batch_size=self.batch_size,
                 paragraph=False,
                 detail=1
             )
-            
-            # Extract text (compatible with current EasyOCR version)
-            return " ".join([result[1] for result in results])
+        # EasyOCR returns crops sorted by position, so match them back by top-left corner
+        unassigned = list(regions)
+        for points, text, confidence in results:
+            x, y = min(p[0] for p in points), min(p[1] for p in points)
+            region = min(unassigned, key=lambda r: (r.box[0] - x) ** 2 + (r.box[1] - y) ** 2)
+            unassigned.remove(region)
+            region.text, region.confidence = text, float(confidence)
+            if not unassigned:
+                break
+
+    def _fill(self, img, regions: List[TextRegion]):
+        """Give every region its text: from the region cache where possible, else recognise"""
+        pending = []
+        for region in regions:
+            x0, y0, x1, y1 = region.box
+            crop = img[y0:y1, x0:x1]
+            if crop.size == 0:
+                continue
+            region.key = self.region_cache.key(crop)
+            found, cached = self.region_cache.lookup(region.key)
+            if found:
+                region.text, region.confidence = cached
+                self.regions_reused += 1
+            else:
+                region.lang = self._script_of(crop)
+                pending.append(region)
+
+        by_lang: Dict[str, List[TextRegion]] = {}
+        for region in pending:
+            by_lang.setdefault(region.lang, []).append(region)
+
+        for lang, group in by_lang.items():
+            reader = self.recognizers.get(lang)
+            # Greedy decoding first; beam search only for the crops it was unsure about
+            self._recognize(img, group, self.decoder, reader)
+            unsure = [r for r in group if r.confidence < self.beam_threshold]
+            if unsure and self.decoder != 'beamsearch':
+                greedy = [(r.text, r.confidence) for r in unsure]
+                self._recognize(img, unsure, 'beamsearch', reader)
+                for region, (text, confidence) in zip(unsure, greedy):
+                    if region.confidence < confidence:
+                        region.text, region.confidence = text, confidence
+        for region in pending:
+            self.region_cache.store(region.key, (region.text, region.confidence))
+        self.regions_recognized += len(pending)
+        metrics.inc("ocr.regions_recognized", len(pending))
+        metrics.inc("ocr.regions_reused", len(regions) - len(pending))
+
+    def read_regions(self, image) -> List[TextRegion]:
+        """
+        Staged OCR: detect text boxes, reuse text for crops seen before, recognise the rest
+        :param image: BGR frame or image path
+        :return: Regions with text, in reading order
+        """
+        img = self.preprocess_image(image)
+        regions = self.detect_regions(img)
+        self._fill(img, regions)
+        with metrics.timer("ocr.postprocess"):
+            found_text = [r for r in regions if r.text]
+            return [r for line in group_lines(found_text) for r in line]
+
+    def stream_lines(self, image, cancel: Optional[threading.Event] = None, only_new=False) -> Iterator[str]:
+        """
+        Yield text lines in reading order as soon as each one is recognised
+        Reading order is known from the detector boxes alone, so the first line can be
+        spoken while the rest of the page is still being recognised.
+        :param image: BGR frame or image path
+        :param cancel: Set it (or close the generator) to stop after the current line
+        :param only_new: Yield "" instead of lines whose crops were all read aloud within
+                         ocr.repeat_after seconds (see reset_reading)
+        """
+        img = self.preprocess_image(image)
+        for line in group_lines(self.detect_regions(img)):
+            if cancel is not None and cancel.is_set():
+                return
+            self._fill(img, line)
+            text = " ".join(r.text for r in line if r.text)
+            if not text:
+                continue
+            keys = [r.key for r in line if r.text and r.key is not None]
+            if only_new and keys and all(self.spoken_regions.lookup(k)[0] for k in keys):
+                yield ""  # still text on the page, just nothing new
+                continue
+            for key in keys:
+                self.spoken_regions.store(key, True)
+            yield text
+
+    def reset_reading(self):
+        """Forget which lines were read aloud, so the next page is read in full"""
+        self.spoken_regions.clear()
+
+    def close(self):
+        """Stop the recogniser pool's idle checks"""
+        self.recognizers.close()
+
+    def read_in_regions(self, image, boxes, padding=0.05) -> List[str]:
+        """
+        Staged OCR restricted to object boxes (e.g. a book or phone found by YOLO)
+        :param image: BGR frame or image path
+        :param boxes: (x1, y1, x2, y2) boxes in frame coordinates
+        :param padding: Margin added around each box, as a fraction of its size
+        :return: Text read in each box, in reading order ("" where nothing was read)
+        """
+        frame = load_frame(image)
+        if frame is None:
+            raise ValueError(f"Could not read image at {describe(image)}")
+        h, w = frame.shape[:2]
+        texts = []
+        for x1, y1, x2, y2 in boxes:
+            pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+            crop = frame[max(0, int(y1 - pad_y)):min(h, int(y2 + pad_y)),
+                         max(0, int(x1 - pad_x)):min(w, int(x2 + pad_x))]
+            if crop.size == 0:
+                texts.append("")
+                continue
+            texts.append(" ".join(region.text for region in self.read_regions(crop)))
+        return texts
+
+    @cached_by_frame
+    def perform_ocr(self, image):
+        """Ultra-optimized OCR pipeline"""
+        try:
+            # Extract text in reading order
+            return " ".join(region.text for region in self.read_regions(image))
             
         except Exception as e:
             print(f"OCR ERROR: {str(e)}", file=sys.stderr)
             return ""
 
+    @staticmethod
+    def _box_of(points) -> Tuple[int, int, int, int]:
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        return max(0, int(min(xs))), max(0, int(min(ys))), int(max(xs)), int(max(ys))
+
+    def _reroute_scripts(self, img, regions: List[TextRegion]):
+        """Re-read crops of another script (e.g. Devanagari) that the primary reader batched"""
+        by_lang: Dict[str, List[TextRegion]] = {}
+        for region in regions:
+            x0, y0, x1, y1 = region.box
+            crop = img[y0:y1, x0:x1]
+            if crop.size:
+                lang = self._script_of(crop)
+                if lang != self.recognizers.primary:
+                    by_lang.setdefault(lang, []).append(region)
+        for lang, group in by_lang.items():
+            self._recognize(img, group, self.decoder, self.recognizers.get(lang))
+
+    def readtext_batch(self, frames, batch_size=None):
+        """
+        OCR several frames with batched recognition across frames
+        The primary reader batches every crop; crops in another script are then re-read by
+        their own recogniser, as in perform_ocr.
+        :param frames: BGR frames (or image paths)
+        :param batch_size: Text crops recognised per forward pass (default: ocr.batch_size)
+        :return: One string per frame
+        """
+        batch_size = batch_size or self.batch_size
+        frames = list(frames)
+        texts = [""] * len(frames)
+        try:
+            imgs = [self.preprocess_image(frame) for frame in frames]
+
+            # readtext_batched needs equally sized images; frames from one camera already are
+            groups = {}
+            for i, img in enumerate(imgs):
+                groups.setdefault(img.shape, []).append(i)
+
+            for indices in groups.values():
+                results = self.reader.readtext_batched(
+                    [imgs[i] for i in indices],
+                    decoder=self.decoder,
+                    beamWidth=self.beam_width,
+                    batch_size=batch_size,
+                    paragraph=False,
+                    detail=1
+                )
+                for i, frame_results in zip(indices, results):
+                    regions = [TextRegion(self._box_of(points), points, free=True, text=text,
+                                          confidence=float(confidence))
+                               for points, text, confidence in frame_results]
+                    self._reroute_scripts(imgs[i], regions)
+                    texts[i] = " ".join(region.text for region in regions if region.text)
+        except Exception as e:
+            print(f"OCR ERROR: {str(e)}", file=sys.stderr)
+        return texts
+
+registry.register('ocr', OCRProcessor, on_unload=OCRProcessor.close)
+
 # The following function is what will be imported by the main application
-def perform_ocr(image_path):
+def perform_ocr(image):
     """
     Standalone function that matches the expected interface
-    This creates an OCRProcessor instance and performs OCR
+    This reuses the shared OCRProcessor instance from the model registry
+    :param image: BGR frame, or path to the image file
+    """
+    return registry.get('ocr').perform_ocr(image)
+
+def stream_ocr(image, cancel=None, only_new=False):
+    """
+    Streaming variant of perform_ocr: yields lines in reading order as they are recognised
+    :param image: BGR frame, or path to the image file
+    :param cancel: Optional threading.Event that stops the stream after the current line
+    :param only_new: Yield "" for lines that were already read aloud recently
     """
-    ocr = OCRProcessor()
-    return ocr.perform_ocr(image_path)
+    return registry.get('ocr').stream_lines(image, cancel, only_new=only_new)
 
 # Example usage
 if __name__ == "__main__":
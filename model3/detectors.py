@@ -0,0 +1,144 @@
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import face_recognition
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # (top, right, bottom, left), as used by face_recognition
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+
+
+class HogDetector:
+    def __init__(self, upsample=1):
+        """dlib HOG detector: cheapest on CPU, needs faces of roughly 80px or more"""
+        self.upsample = upsample
+
+    def detect(self, rgb: np.ndarray) -> List[Box]:
+        return face_recognition.face_locations(rgb, self.upsample, model='hog')
+
+
+class CnnDetector:
+    def __init__(self, upsample=1):
+        """dlib CNN (MMOD) detector: better recall on small and turned faces, much slower without a GPU"""
+        self.upsample = upsample
+
+    def detect(self, rgb: np.ndarray) -> List[Box]:
+        return face_recognition.face_locations(rgb, self.upsample, model='cnn')
+
+
+class OpenCVDnnDetector:
+    def __init__(self, prototxt: Optional[str] = None, weights: Optional[str] = None,
+                 confidence=0.5, input_size=300):
+        """
+        OpenCV DNN ResNet-10 SSD face detector
+        :param prototxt: Path to deploy.prototxt (defaults to model3/models/)
+        :param weights: Path to res10_300x300_ssd_iter_140000.caffemodel (defaults to model3/models/)
+        """
+        prototxt = prototxt or os.path.join(MODELS_DIR, 'deploy.prototxt')
+        weights = weights or os.path.join(MODELS_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+        for path in (prototxt, weights):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"OpenCV DNN face model not found at {path}")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.confidence = confidence
+        self.input_size = input_size
+
+    def detect(self, rgb: np.ndarray) -> List[Box]:
+        h, w = rgb.shape[:2]
+        # The SSD was trained on BGR input: swap the channels back, with the means in BGR order
+        # (blobFromImage swaps the mean along with the image)
+        blob = cv2.dnn.blobFromImage(rgb, 1.0, (self.input_size, self.input_size),
+                                     (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = []
+        for x1, y1, x2, y2 in (detections[:, 3:7] * [w, h, w, h]).astype(int):
+            top, left = max(0, y1), max(0, x1)
+            bottom, right = min(h, y2), min(w, x2)
+            if bottom > top and right > left:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+DETECTORS = {
+    'hog': HogDetector,
+    'cnn': CnnDetector,
+    'dnn': OpenCVDnnDetector,
+}
+
+
+def make_detector(name: str, **kwargs):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector '{name}' (choose from {', '.join(DETECTORS)})")
+    return DETECTORS[name](**kwargs)
+
+
+def _scale_box(box: Box, factor: float, offset: Tuple[int, int] = (0, 0)) -> Box:
+    top, right, bottom, left = box
+    dy, dx = offset
+    return (int(top * factor) + dy, int(right * factor) + dx,
+            int(bottom * factor) + dy, int(left * factor) + dx)
+
+
+class MultiScaleDetector:
+    def __init__(self, detector, scales: Sequence[float] = (0.25, 0.5), refine=True,
+                 crop_padding=0.5, refine_face_size=120):
+        """
+        Resolution ladder: detect small, climb only when needed, refine on full-res crops
+        :param detector: Any object with detect(rgb) -> boxes
+        :param scales: Frame scales tried in order; the next rung runs only if nothing was found
+        :param refine: Re-detect each candidate on a padded full-resolution crop
+        :param crop_padding: Padding around a candidate, as a fraction of its size
+        :param refine_face_size: Face width (px) the crop is scaled to for re-detection
+        """
+        self.detector = detector
+        self.scales = tuple(scales)
+        self.refine = refine
+        self.crop_padding = crop_padding
+        self.refine_face_size = refine_face_size
+        self.timings: Dict[str, float] = {}
+
+    def detect(self, rgb: np.ndarray) -> List[Box]:
+        """Face boxes in full-resolution coordinates"""
+        self.timings = {}
+        candidates: List[Box] = []
+        for scale in self.scales:
+            start = time.perf_counter()
+            small = rgb if scale == 1.0 else cv2.resize(rgb, (0, 0), fx=scale, fy=scale)
+            candidates = [_scale_box(b, 1.0 / scale) for b in self.detector.detect(small)]
+            self.timings[f'detect@{scale:g}'] = time.perf_counter() - start
+            if candidates:
+                break
+
+        if not (self.refine and candidates):
+            return candidates
+
+        start = time.perf_counter()
+        refined = [self._refine(rgb, box) for box in candidates]
+        self.timings['refine'] = time.perf_counter() - start
+        return refined
+
+    def _refine(self, rgb: np.ndarray, box: Box) -> Box:
+        h, w = rgb.shape[:2]
+        top, right, bottom, left = box
+        pad_y = int((bottom - top) * self.crop_padding)
+        pad_x = int((right - left) * self.crop_padding)
+        y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+        x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+        crop = rgb[y0:y1, x0:x1]
+        if crop.size == 0:
+            return box
+
+        factor = min(1.0, self.refine_face_size / max(1, right - left))
+        small = crop if factor == 1.0 else cv2.resize(crop, (0, 0), fx=factor, fy=factor)
+        found = self.detector.detect(small)
+        if not found:
+            return box  # keep the coarse box rather than lose the face
+        # The crop may contain neighbours: keep the detection closest to the candidate's centre
+        cy, cx = (y1 - y0) / 2 * factor, (x1 - x0) / 2 * factor
+        best = min(found, key=lambda b: ((b[0] + b[2]) / 2 - cy) ** 2 + ((b[1] + b[3]) / 2 - cx) ** 2)
+        return _scale_box(best, 1.0 / factor, (y0, x0))
@@ -75,41 +75,228 @@
 import face_recognition
 import cv2
 import os
-import glob
+import time
 import numpy as np
-from typing import List, Tuple
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+from config import get_config
+from metrics import metrics
+from registry import registry
+from frames import ImageInput, load_frame
+from result_cache import ResultCache
+from model3.gallery import FaceGallery, GalleryWatcher, encode_frame, file_meta
+from model3.detectors import Box, MultiScaleDetector, make_detector
+
+def box_iou(a: Box, b: Box) -> float:
+    """Intersection over union of two face boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+class FaceTrack:
+    def __init__(self, track_id: int, box: Box, now: float):
+        """One face followed across frames, carrying the identity found at its last encoding"""
+        self.track_id = track_id
+        self.box = box
+        self.last_seen = now
+        self.misses = 0             # analysed frames in a row without a matching detection
+        self.label = ""             # spoken result, e.g. "Harsh" or "Unknown person"
+        self.encoded_box: Optional[Box] = None
+        self.encoded_at = 0.0
+        self.announced_label = None
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_misses=2, drift_iou=0.5, reverify_interval=5.0):
+        """
+        Associate face boxes across frames so identities are reused instead of re-encoded
+        :param iou_threshold: Minimum IoU for a detection to continue a track
+        :param max_misses: Analysed frames a track survives without being detected (counted in
+                           frames, not seconds, because the scheduler spaces analyses irregularly)
+        :param drift_iou: Re-encode when the box overlaps its last encoded box less than this
+        :param reverify_interval: Re-encode every track at least this often (seconds)
+        """
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.drift_iou = drift_iou
+        self.reverify_interval = reverify_interval
+        self.tracks: List[FaceTrack] = []
+        self._ids = count(1)
+
+    def update(self, boxes: List[Box], now: float) -> List[FaceTrack]:
+        """
+        Match this frame's detections to existing tracks (greedy, highest IoU first)
+        :return: One track per box, in the order of boxes (new tracks for unmatched boxes)
+        """
+        pairs = sorted(((box_iou(box, t.box), i, j) for i, box in enumerate(boxes)
+                        for j, t in enumerate(self.tracks)), reverse=True)
+
+        assigned: List[Optional[FaceTrack]] = [None] * len(boxes)
+        used = set()
+        for iou, i, j in pairs:
+            if iou < self.iou_threshold:
+                break
+            if assigned[i] is None and j not in used:
+                assigned[i] = self.tracks[j]
+                used.add(j)
+
+        for j, track in enumerate(self.tracks):
+            if j not in used:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for i, box in enumerate(boxes):
+            if assigned[i] is None:
+                assigned[i] = FaceTrack(next(self._ids), box, now)
+                self.tracks.append(assigned[i])
+            assigned[i].box = box
+            assigned[i].last_seen = now
+            assigned[i].misses = 0
+        return assigned
+
+    def needs_encoding(self, track: FaceTrack, now: float) -> bool:
+        """New, drifted or due for re-verification"""
+        return (track.encoded_box is None
+                or box_iou(track.box, track.encoded_box) < self.drift_iou
+                or now - track.encoded_at >= self.reverify_interval)
+
+    def clear(self):
+        self.tracks = []
 
 class FaceRecognizer:
     def __init__(self):
         """Initialize once during application startup"""
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.frame_resizing = 0.25
-        self.confidence_threshold = 0.6  # Below this: confident match
-        self.unsure_threshold = 0.8     # Between confidence and unsure: possible match
+        self.result_cache = ResultCache(ttl=10.0, max_distance=4)  # near-duplicate frames reuse face boxes
+        self.images_dir = os.path.join(os.path.dirname(__file__), 'images')
+        self.gallery = FaceGallery(self.images_dir)
+        self.tracker = FaceTracker()
+        self._tracked_version = None
+        self.encodings_computed = 0  # faces actually encoded (the rest reused a track)
+        self.last_timings: Dict[str, float] = {}
+        self.detector = None
+        self.watcher = None
+        self.watch_interval = None
+        self.apply_config(get_config().face)
         
         self._load_known_faces()
 
+    def apply_config(self, cfg):
+        """Take new detection/matching settings; the gallery and loaded encodings are kept"""
+        detection = (cfg.detector, cfg.frame_resizing, tuple(cfg.ladder_scales), cfg.refine_on_crops)
+        rebuild = self.detector is None or detection != (
+            self.detector_name, self.frame_resizing, tuple(self.ladder_scales), self.refine_on_crops)
+        relabel = self.detector is not None and (cfg.confidence_threshold, cfg.unsure_threshold) != (
+            self.confidence_threshold, self.unsure_threshold)
+        self.detector_name = cfg.detector  # 'hog', 'cnn' or 'dnn' (see model3/detectors.py)
+        self.frame_resizing = cfg.frame_resizing  # first rung of the detection resolution ladder
+        self.ladder_scales = tuple(cfg.ladder_scales)  # tried in order only when nothing is found
+        self.refine_on_crops = cfg.refine_on_crops  # re-detect candidates on full-resolution crops
+        self.confidence_threshold = cfg.confidence_threshold  # Below this: confident match
+        self.unsure_threshold = cfg.unsure_threshold  # Between confidence and unsure: possible match
+        if rebuild:
+            self.build_detector()
+            self.result_cache.clear()  # boxes found by the old detector
+        if relabel:
+            self.tracker.clear()  # tracked labels were decided with the old thresholds
+        self.tracker.max_misses = cfg.track_max_misses
+
+        if cfg.watch_interval != self.watch_interval:
+            if self.watcher is not None:
+                self.watcher.stop()
+            self.watch_interval = cfg.watch_interval  # seconds between enrollment scans (None disables)
+            self.watcher = (GalleryWatcher(self.refresh_gallery, self.watch_interval).start()
+                            if self.watch_interval else None)
+
     def _load_known_faces(self):
-        """Load known faces from directory (runs once)"""
-        encodings_path = os.path.join(os.path.dirname(__file__), 'images')
-        if os.path.exists(encodings_path):
-            images_path = glob.glob(os.path.join(encodings_path, "*.*"))
-            
-            for img_path in images_path:
-                img = cv2.imread(img_path)
-                if img is None:
-                    continue
+        """Load known faces from the on-disk gallery cache, encoding only new or changed images"""
+        encoded = self.gallery.sync()
+        print(f"Loaded {len(self.gallery)} known faces ({encoded} images encoded)")
+
+    def build_detector(self):
+        """(Re)build the detection strategy from the current settings"""
+        self.detector = MultiScaleDetector(
+            make_detector(self.detector_name),
+            scales=(self.frame_resizing,) + tuple(self.ladder_scales),
+            refine=self.refine_on_crops,
+        )
+
+    def refresh_gallery(self) -> Tuple[int, int]:
+        """Pick up images added, changed or deleted in the images directory"""
+        version = self.gallery.version
+        encoded, removed = self.gallery.refresh()
+        if self.gallery.version != version:
+            print(f"Face gallery updated: {encoded} images encoded, {removed} removed")
+        return encoded, removed
+
+    def _enroll(self, name: str, image: ImageInput, encodings: Optional[np.ndarray] = None) -> int:
+        """:param encodings: Encodings of image when the caller already computed them"""
+        frame = load_frame(image)
+        if frame is None:
+            return 0
+        if encodings is None:
+            encodings = encode_frame(frame)
+        if not len(encodings):
+            return 0
+
+        # The images directory stays the source of truth, so a restart sees the same gallery
+        os.makedirs(self.images_dir, exist_ok=True)
+        source = f"{name}_{int(time.time() * 1000)}.jpg"
+        path = os.path.join(self.images_dir, source)
+        cv2.imwrite(path, frame)
+        self.gallery.add(name, encodings, source, file_meta(path))
+        self.gallery.save()
+        return len(encodings)
+
+    def add_person(self, name: str, image: ImageInput) -> int:
+        """
+        Enroll a person (or another photo of them) without restarting
+        :param name: Name to announce for this person
+        :param image: BGR frame or image path showing only this person's face
+        :return: Number of embeddings added (0 if no face was found)
+        """
+        return self._enroll(name, image)
+
+    def update_from_frame(self, name: str, frame: np.ndarray, replace: bool = False) -> int:
+        """
+        Add an embedding for a known person from a live frame
+        :param replace: Drop the person's previous embeddings first (e.g. after a big change in looks)
+        :return: Number of embeddings added (0 if no face was found; nothing is replaced then)
+        """
+        encodings = encode_frame(frame)
+        if replace and len(encodings):
+            self.remove_person(name)
+        return self._enroll(name, frame, encodings)
+
+    def remove_person(self, name: str, delete_images: bool = True) -> int:
+        """
+        Forget a person
+        :param delete_images: Also delete their photos so the watcher does not re-enroll them
+        :return: Number of photos the person had
+        """
+        sources = self.gallery.remove_identity(name)
+        if delete_images:
+            for source in sources:
+                try:
+                    os.remove(os.path.join(self.images_dir, source))
+                except FileNotFoundError:
+                    pass
+        self.gallery.save()
+        return len(sources)
 
-                rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                basename = os.path.basename(img_path)
-                filename = os.path.splitext(basename)[0]
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
 
-                encodings = face_recognition.face_encodings(rgb_img)
-                if encodings:
-                    self.known_face_encodings.append(encodings[0])
-                    self.known_face_names.append(filename)
-            print(f"Loaded {len(self.known_face_names)} known faces")
+    @property
+    def known_face_encodings(self) -> np.ndarray:
+        return self.gallery.encodings
+
+    @property
+    def known_face_names(self) -> List[str]:
+        return self.gallery.names
 
     def _get_face_confidence(self, face_distance: float) -> Tuple[str, str]:
         """Determine confidence level and appropriate message"""
@@ -119,60 +306,171 @@ class FaceRecognizer:
             return ("unsure", "I'm not sure, but this might be ")
         return ("unknown", "Unknown person")
 
-    def recognize_faces(self, image_path: str) -> List[str]:
-        """Recognize faces with confidence analysis"""
-        frame = cv2.imread(image_path)
+    def _label(self, best_name: str, distance: float) -> str:
+        """Format response based on confidence"""
+        confidence, prefix = self._get_face_confidence(distance)
+        if confidence == "confident":
+            return best_name
+        elif confidence == "unsure":
+            return f"{prefix}{best_name}"
+        return prefix
+
+    def detect_in_regions(self, rgb: np.ndarray, regions, head_fraction=0.5, max_width=240) -> List[Box]:
+        """
+        Look for faces only inside person boxes, e.g. from YOLO
+        :param rgb: Full RGB frame
+        :param regions: (x1, y1, x2, y2) person boxes in frame coordinates
+        :param head_fraction: Upper part of each person box that is searched
+        :param max_width: Crops wider than this are downscaled before detection
+        :return: Face boxes in full-frame coordinates
+        """
+        h, w = rgb.shape[:2]
+        boxes: List[Box] = []
+        for x1, y1, x2, y2 in regions:
+            x1, x2 = max(0, int(x1)), min(w, int(x2))
+            y1 = max(0, int(y1))
+            y2 = min(h, int(y1 + (y2 - y1) * head_fraction))
+            crop = rgb[y1:y2, x1:x2]
+            if crop.size == 0:
+                continue
+            factor = min(1.0, max_width / crop.shape[1])
+            small = crop if factor == 1.0 else cv2.resize(crop, (0, 0), fx=factor, fy=factor)
+            for top, right, bottom, left in self.detector.detector.detect(small):
+                box = (int(top / factor) + y1, int(right / factor) + x1,
+                       int(bottom / factor) + y1, int(left / factor) + x1)
+                # Overlapping person boxes can find the same face twice
+                if all(box_iou(box, other) < 0.5 for other in boxes):
+                    boxes.append(box)
+        return boxes
+
+    def _track_frames(self, frames: List[np.ndarray], track: bool = True,
+                      regions: Optional[List[list]] = None) -> List[List[FaceTrack]]:
+        """
+        Detect faces, follow them across frames and encode only the faces that need it
+        :param frames: BGR frames in capture order
+        :param track: Follow faces across calls; False treats every frame as unrelated (all faces encoded)
+        :param regions: Per frame, person boxes to search instead of the whole frame
+        :return: The tracks seen in each frame
+        """
+        now = time.monotonic()
+        if self._tracked_version != self.gallery.version:
+            self.tracker.clear()  # identities may have changed
+            self._tracked_version = self.gallery.version
+
+        timings: Dict[str, float] = {}
+        def add_time(stage, seconds):
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+        per_frame, stale, face_encodings = [], [], []
+        for i, frame in enumerate(frames):
+            # Preprocess frame
+            start = time.perf_counter()
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            add_time('preprocess', time.perf_counter() - start)
+            
+            if regions is not None:
+                start = time.perf_counter()
+                face_locations = self.detect_in_regions(rgb_frame, regions[i])
+                add_time('detect_regions', time.perf_counter() - start)
+            else:
+                # Detect all faces (small first, full-resolution crops only around candidates);
+                # a near-duplicate of a recent frame reuses its boxes
+                key = self.result_cache.key(frame)
+                found, face_locations = self.result_cache.lookup(key)
+                if not found:
+                    face_locations = self.detector.detect(rgb_frame)
+                    for stage, seconds in self.detector.timings.items():
+                        add_time(stage, seconds)
+                    self.result_cache.store(key, face_locations)
+            tracks = (self.tracker if track else FaceTracker()).update(face_locations, now)
+            per_frame.append(tracks)
+
+            pending = [t for t in tracks if self.tracker.needs_encoding(t, now)]
+            if not pending:
+                continue
+
+            # Encoding only looks at the given boxes, so full resolution costs nothing extra here
+            start = time.perf_counter()
+            face_encodings += face_recognition.face_encodings(rgb_frame, [t.box for t in pending])
+            add_time('encode', time.perf_counter() - start)
+            for t in pending:
+                t.encoded_box = t.box  # later frames in this batch reuse the encoding
+                t.encoded_at = now
+            stale += pending
+
+        self.encodings_computed += len(face_encodings)
+        if stale:
+            start = time.perf_counter()
+            if not len(self.gallery):
+                labels = ["Unknown person"] * len(face_encodings)
+            else:
+                # One batched distance computation for every face in every frame
+                best_names, min_distances = self.gallery.match_names(np.asarray(face_encodings))
+                labels = [self._label(n, d) for n, d in zip(best_names, min_distances)]
+            add_time('match', time.perf_counter() - start)
+            for t, label in zip(stale, labels):
+                t.label = label
+
+        self.last_timings = timings
+        metrics.record_timings("face", timings)
+        metrics.inc("face.encodings_computed", len(face_encodings))
+        return per_frame
+
+    def _track_faces(self, frame: np.ndarray, regions=None) -> List[FaceTrack]:
+        return self._track_frames([frame], regions=None if regions is None else [regions])[0]
+
+    def recognize_faces(self, image: ImageInput) -> List[str]:
+        """Recognize faces with confidence analysis (accepts a BGR frame or a path)"""
+        frame = load_frame(image)
         if frame is None:
             return []
+        return [track.label for track in self._track_faces(frame)]
 
-        # Preprocess frame
-        small_frame = cv2.resize(frame, (0, 0), fx=self.frame_resizing, fy=self.frame_resizing)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-        
-        # Detect all faces
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-
-        recognized_faces = []
-        if not self.known_face_encodings:
-            return ["Unknown person"] * len(face_encodings)
-
-        for face_encoding in face_encodings:
-            # Calculate distances to known faces
-            face_distances = face_recognition.face_distance(
-                self.known_face_encodings, face_encoding
-            )
-            best_match_index = np.argmin(face_distances)
-            min_distance = face_distances[best_match_index]
-
-            # Determine confidence level
-            confidence, prefix = self._get_face_confidence(min_distance)
-            name = self.known_face_names[best_match_index] if confidence != "unknown" else ""
-
-            # Format response based on confidence
-            if confidence == "confident":
-                recognized_faces.append(name)
-            elif confidence == "unsure":
-                recognized_faces.append(f"{prefix}{name}")
-            else:
-                recognized_faces.append(prefix)
+    def recognize_batch(self, frames: List[np.ndarray], track: bool = True) -> List[List[str]]:
+        """
+        Recognize faces in several frames at once (e.g. recorded footage or a burst)
+        :param frames: BGR frames, in capture order when track is True
+        :param track: Reuse identities across consecutive frames instead of encoding every face
+        :return: One list of names per frame
+        """
+        return [[t.label for t in tracks] for tracks in self._track_frames(list(frames), track)]
 
-        return recognized_faces
+    def recognize_new_faces(self, image: ImageInput, regions=None) -> List[str]:
+        """
+        Like recognize_faces, but only returns people who just arrived (or whose identity changed)
+        :param image: BGR frame, or path to the image file
+        :param regions: Optional person boxes (x1, y1, x2, y2); only these are searched for faces
+        """
+        frame = load_frame(image)
+        if frame is None:
+            return []
+        arrivals = []
+        for track in self._track_faces(frame, regions):
+            if track.label != track.announced_label:
+                track.announced_label = track.label
+                arrivals.append(track.label)
+        return arrivals
 
-# Initialize once when module loads
-recognizer = FaceRecognizer()
+# Built once on first use and kept warm by the registry
+registry.register('face', FaceRecognizer, on_unload=FaceRecognizer.close)
 
-def recognize_faces(image_path: str) -> List[str]:
+def recognize_faces(image: ImageInput) -> List[str]:
     """Main interface function"""
-    return recognizer.recognize_faces(image_path)
+    return registry.get('face').recognize_faces(image)
+
+def recognize_new_faces(image: ImageInput) -> List[str]:
+    """Only people who were not in view on the previous analysed frames"""
+    return registry.get('face').recognize_new_faces(image)
 
-def recognize_objects(image_path: str) -> List[str]:
-    return recognize_faces(image_path)
+def recognize_objects(image: ImageInput) -> List[str]:
+    return recognize_faces(image)
 
 if __name__ == "__main__":
     test_img = "test.jpg"
     if os.path.exists(test_img):
         results = recognize_faces(test_img)
         print("Recognized faces:", ", ".join(results))
+        timings = registry.get('face').last_timings
+        print("Stage timings:", ", ".join(f"{k}: {v * 1000:.1f}ms" for k, v in timings.items()))
     else:
         print(f"Test image {test_img} not found")
\ No newline at end of file
@@ -0,0 +1,331 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import face_recognition
+import numpy as np
+
+ENCODING_DIM = 128
+ENCODINGS_FILE = "gallery_encodings.npy"
+INDEX_FILE = "gallery_index.json"
+
+# "Harsh.jpg", "Harsh_2.jpg" and "Harsh_1717171717.jpg" all enroll the identity "Harsh"
+_EXTRA_PHOTO_SUFFIX = re.compile(r"^(.+?)_\d+$")
+
+
+def identity_from_filename(filename: str) -> str:
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    match = _EXTRA_PHOTO_SUFFIX.match(stem)
+    return match.group(1) if match else stem
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_meta(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "sha1": _file_digest(path)}
+
+
+def encode_frame(frame: np.ndarray) -> np.ndarray:
+    """Encode the first face found in a BGR frame (empty array if none)"""
+    rgb_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(rgb_img)
+    if not encodings:
+        return np.empty((0, ENCODING_DIM), dtype=np.float32)
+    return np.asarray(encodings[:1], dtype=np.float32)
+
+
+def _encode_image(path: str) -> np.ndarray:
+    img = cv2.imread(path)
+    if img is None:
+        return np.empty((0, ENCODING_DIM), dtype=np.float32)
+    return encode_frame(img)
+
+
+def pairwise_distances(queries: np.ndarray, gallery: np.ndarray) -> np.ndarray:
+    """Euclidean distances between every query and every gallery row in one matrix product"""
+    q2 = np.einsum("ij,ij->i", queries, queries)[:, None]
+    g2 = np.einsum("ij,ij->i", gallery, gallery)[None, :]
+    d2 = q2 + g2 - 2.0 * (queries @ gallery.T)
+    return np.sqrt(np.maximum(d2, 0.0))
+
+
+class PartitionedIndex:
+    def __init__(self, encodings: np.ndarray, n_lists: Optional[int] = None, n_probe=3,
+                 iterations=10, seed=0):
+        """
+        Inverted-file index: k-means partitions, search only the closest few
+        :param encodings: Gallery matrix (N, 128) float32
+        :param n_lists: Number of partitions (defaults to sqrt(N))
+        :param n_probe: Partitions searched per query (more = better recall, slower)
+        """
+        self.n_probe = n_probe
+        n = len(encodings)
+        n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+
+        rng = np.random.default_rng(seed)
+        self.centroids = encodings[rng.choice(n, n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmin(pairwise_distances(encodings, self.centroids), axis=1)
+            for c in range(n_lists):
+                members = encodings[assignment == c]
+                if len(members):
+                    self.centroids[c] = members.mean(axis=0)
+        assignment = np.argmin(pairwise_distances(encodings, self.centroids), axis=1)
+        self.lists = [list(np.flatnonzero(assignment == c)) for c in range(n_lists)]
+
+    def add(self, first_row: int, rows: np.ndarray):
+        """File newly appended gallery rows under their nearest centroid"""
+        for offset, c in enumerate(np.argmin(pairwise_distances(rows, self.centroids), axis=1)):
+            self.lists[c].append(first_row + offset)
+
+    def search(self, queries: np.ndarray, encodings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate nearest gallery row and its distance for each query"""
+        probes = np.argsort(pairwise_distances(queries, self.centroids), axis=1)[:, :self.n_probe]
+        best = np.zeros(len(queries), dtype=np.int64)
+        best_distance = np.full(len(queries), np.inf, dtype=np.float32)
+        for i, lists in enumerate(probes):
+            candidates = np.fromiter((r for c in lists for r in self.lists[c]), dtype=np.int64)
+            if not len(candidates):
+                continue
+            distances = pairwise_distances(queries[i:i + 1], encodings[candidates])[0]
+            j = int(np.argmin(distances))
+            best[i], best_distance[i] = candidates[j], distances[j]
+        return best, best_distance
+
+
+class FaceGallery:
+    def __init__(self, images_dir: str, cache_dir: Optional[str] = None, ann_threshold=2000):
+        """
+        Known-face encodings held as one float32 matrix and persisted between runs
+        :param images_dir: Directory with one image per enrolled photo (see identity_from_filename)
+        :param cache_dir: Where the .npy matrix and the JSON name index live
+        :param ann_threshold: Gallery size from which a partitioned index is used for matching
+        """
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(__file__), "gallery_cache")
+        self.ann_threshold = ann_threshold
+
+        # Rows live in a growable buffer so enrollment appends without copying the gallery
+        self._buffer = np.empty((16, ENCODING_DIM), dtype=np.float32)
+        self._count = 0
+        self.names: List[str] = []
+        self.sources: List[str] = []
+        self._files: Dict[str, Dict] = {}
+        self._index: Optional[PartitionedIndex] = None
+        self._lock = threading.RLock()
+        self.version = 0  # bumped on every change so callers can drop derived caches
+        self._load_cache()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def encodings(self) -> np.ndarray:
+        return self._buffer[:self._count]
+
+    def identities(self) -> List[str]:
+        return sorted(set(self.names))
+
+    def _load_cache(self):
+        encodings_path = os.path.join(self.cache_dir, ENCODINGS_FILE)
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        if not (os.path.exists(encodings_path) and os.path.exists(index_path)):
+            return
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            encodings = np.load(encodings_path).astype(np.float32, copy=False)
+            if len(encodings) != len(index["rows"]):
+                raise ValueError("encoding matrix and name index disagree")
+        except Exception as e:
+            print(f"Ignoring face gallery cache: {str(e)}")
+            return
+        self._append(encodings, [row["name"] for row in index["rows"]],
+                     [row["source"] for row in index["rows"]])
+        self._files = index["files"]
+
+    def save(self):
+        """Write the matrix and the name index atomically"""
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            encodings_path = os.path.join(self.cache_dir, ENCODINGS_FILE)
+            index_path = os.path.join(self.cache_dir, INDEX_FILE)
+            with open(encodings_path + ".tmp", "wb") as f:
+                np.save(f, self.encodings)
+            with open(index_path + ".tmp", "w") as f:
+                json.dump({
+                    "rows": [{"name": n, "source": s} for n, s in zip(self.names, self.sources)],
+                    "files": self._files,
+                }, f)
+            os.replace(encodings_path + ".tmp", encodings_path)
+            os.replace(index_path + ".tmp", index_path)
+
+    def _append(self, rows: np.ndarray, names: List[str], sources: List[str]):
+        needed = self._count + len(rows)
+        if needed > len(self._buffer):
+            grown = np.empty((max(needed, 2 * len(self._buffer)), ENCODING_DIM), dtype=np.float32)
+            grown[:self._count] = self.encodings
+            self._buffer = grown
+        first = self._count
+        self._buffer[first:needed] = rows
+        self._count = needed
+        self.names += names
+        self.sources += sources
+        if self._index is not None:
+            self._index.add(first, rows)
+
+    def _remove_rows(self, rows: Iterable[int]):
+        # Swap-with-last keeps removal proportional to the rows removed
+        for row in sorted(rows, reverse=True):
+            last = self._count - 1
+            if row != last:
+                self._buffer[row] = self._buffer[last]
+                self.names[row] = self.names[last]
+                self.sources[row] = self.sources[last]
+            self.names.pop()
+            self.sources.pop()
+            self._count = last
+        self._index = None  # row numbers moved; rebuilt on the next large-gallery match
+
+    def add(self, name: str, encodings: np.ndarray, source: str, meta: Optional[Dict] = None):
+        """
+        Add embeddings for an identity (an identity may have any number of rows)
+        :param source: Image file the embeddings came from, relative to images_dir
+        :param meta: mtime/size/sha1 of that file (see file_meta), so restarts do not re-encode it
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            self._append(encodings, [name] * len(encodings), [source] * len(encodings))
+            if meta is not None:
+                self._files[source] = meta
+            self.version += 1
+
+    def remove_source(self, source: str) -> int:
+        """Drop every row that came from one image file"""
+        with self._lock:
+            rows = [i for i, s in enumerate(self.sources) if s == source]
+            self._remove_rows(rows)
+            self._files.pop(source, None)
+            self.version += 1
+            return len(rows)
+
+    def remove_identity(self, name: str) -> List[str]:
+        """
+        Drop every row of an identity
+        :return: Source files that belonged to it
+        """
+        with self._lock:
+            rows = [i for i, n in enumerate(self.names) if n == name]
+            sources = sorted({self.sources[i] for i in rows})
+            self._remove_rows(rows)
+            for source in sources:
+                self._files.pop(source, None)
+            self.version += 1
+            return sources
+
+    def refresh(self) -> Tuple[int, int]:
+        """
+        Bring the gallery in line with images_dir, touching only changed files
+        :return: (image files encoded, image files removed)
+        """
+        with self._lock:
+            present = set()
+            encoded = 0
+            dirty = False
+            for path in sorted(glob.glob(os.path.join(self.images_dir, "*.*"))):
+                source = os.path.basename(path)
+                present.add(source)
+                stat = os.stat(path)
+                meta = self._files.get(source)
+                if meta and meta["mtime"] == stat.st_mtime and meta["size"] == stat.st_size:
+                    continue
+
+                new_meta = file_meta(path)
+                if meta and meta["sha1"] == new_meta["sha1"]:
+                    self._files[source] = new_meta  # touched, not changed
+                else:
+                    if meta:
+                        self.remove_source(source)
+                    self.add(identity_from_filename(source), _encode_image(path), source, new_meta)
+                    encoded += 1
+                dirty = True
+
+            removed = [source for source in self._files if source not in present]
+            for source in removed:
+                self.remove_source(source)
+            if dirty or removed:
+                self.save()
+            return encoded, len(removed)
+
+    def sync(self) -> int:
+        """Startup refresh: returns the number of image files that had to be encoded"""
+        return self.refresh()[0]
+
+    def match(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest enrolled encoding for every face in a frame
+        :param queries: (M, 128) encodings of the detected faces
+        :return: (row indices, distances), both of length M
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            if not len(queries) or not self._count:
+                return (np.zeros(len(queries), dtype=np.int64),
+                        np.full(len(queries), np.inf, dtype=np.float32))
+
+            if self._count >= self.ann_threshold:
+                if self._index is None:
+                    self._index = PartitionedIndex(self.encodings)
+                return self._index.search(queries, self.encodings)
+
+            distances = pairwise_distances(queries, self.encodings)
+            best = np.argmin(distances, axis=1)
+            return best, distances[np.arange(len(queries)), best]
+
+    def match_names(self, queries: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Like match(), but resolves rows to names while the gallery cannot change underneath"""
+        with self._lock:
+            best, distances = self.match(queries)
+            names = [self.names[i] if self._count else "" for i in best]
+            return names, distances
+
+
+class GalleryWatcher:
+    def __init__(self, refresh, interval=5.0):
+        """
+        Poll the enrollment directory and apply changes without a restart
+        :param refresh: Callable that rescans the directory (stat calls only when nothing changed)
+        :param interval: Seconds between scans
+        """
+        self._refresh = refresh
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"Gallery refresh error: {str(e)}")
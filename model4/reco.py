@@ -1,108 +1,274 @@
 import os
 import cv2
-from ultralytics import YOLO
+import numpy as np
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
+from config import get_config
+from metrics import metrics
+from registry import registry
+from frames import ImageInput, describe, load_frame
+from result_cache import ResultCache
+from model4.runtime import YOLORuntime
+from model4.tracker import ObjectTracker
+
+@dataclass
+class Detections:
+    """Everything one YOLO pass found in a frame; speech, overlays and logs are all rendered from it"""
+    boxes: np.ndarray          # (N, 4) int xyxy pixel boxes
+    class_ids: np.ndarray      # (N,) int
+    confidences: np.ndarray    # (N,) float
+    names: List[str]           # class name per detection
+    distances: List[str]       # "close" / "far" per detection
+    frame_shape: Tuple[int, int]
+
+    def __len__(self):
+        return len(self.names)
+
+    def select(self, keep: np.ndarray) -> 'Detections':
+        """Subset by boolean mask"""
+        return Detections(
+            boxes=self.boxes[keep],
+            class_ids=self.class_ids[keep],
+            confidences=self.confidences[keep],
+            names=[n for n, k in zip(self.names, keep) if k],
+            distances=[d for d, k in zip(self.distances, keep) if k],
+            frame_shape=self.frame_shape,
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """Detections per class, in order of first appearance"""
+        counts = {}
+        for name in self.names:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def to_phrases(self) -> List[str]:
+        """Spoken form, e.g. ["2 chairs", "1 person"]"""
+        return [f"{cnt} {cls}{'s' if cnt > 1 else ''}" for cls, cnt in self.counts().items()]
+
+    def describe(self) -> str:
+        """One-line log form"""
+        return ", ".join(f"{name} {conf:.2f} ({dist})"
+                         for name, conf, dist in zip(self.names, self.confidences, self.distances))
+
+    def annotate(self, frame: np.ndarray) -> np.ndarray:
+        """Draw boxes, labels and the per-class counts on a copy of the frame"""
+        frame = frame.copy()  # never draw on the caller's frame
+        for (x1, y1, x2, y2), name, dist_label in zip(self.boxes, self.names, self.distances):
+            text = f"{name} ({dist_label})"
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0,255,0), 2)
+            cv2.putText(frame, text, (x1, y1 - 6),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1)
+        
+        # Add counts overlay
+        y0 = 20
+        for cls, cnt in self.counts().items():
+            cv2.putText(frame, f"{cls}: {cnt}", (10, y0),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,255), 2)
+            y0 += 25
+        return frame
 
 class ObjectRecognizer:
     def __init__(self):
         """Initialize the object recognition system"""
-        self.model = YOLO('yolov8l.pt')
-        self.conf_threshold = 0.4
-        self.close_threshold = 0.2
-        self.prev_counts = {}
+        cfg = get_config().objects
+        self.model_size = cfg.model_size  # 'n', 's', 'm' or 'l' (see model4/runtime.py)
+        self.backend = cfg.backend  # 'pytorch', 'torchscript', 'onnx' or 'openvino'
+        self.imgsz = cfg.imgsz
+        self.model = YOLORuntime(self.model_size, self.backend, self.imgsz)  # exported once, warmed up
+        self.tracker: Optional[ObjectTracker] = None
+        self.last_detections: Optional[Detections] = None
+        self.result_cache = ResultCache(ttl=5.0, max_distance=4)  # near-duplicate frames reuse detections
+        self.apply_config(cfg)
+
+    def apply_config(self, cfg):
+        """Take new thresholds without reloading the model (size/backend/imgsz need a rebuild)"""
+        self.conf_threshold = cfg.conf_threshold
+        self.close_threshold = cfg.close_threshold
+        self.batch_size = cfg.batch_size  # frames per YOLO call in detect_batch()
+        self.track_low_conf = cfg.track_low_conf
+        self.result_cache.clear()  # cached detections were filtered with the old thresholds
+        if self.tracker is None:
+            self.tracker = ObjectTracker(cfg.track_iou, max_misses=cfg.track_max_misses,
+                                         min_hits=cfg.track_min_hits)
+        else:
+            self.tracker.iou_threshold = cfg.track_iou
+            self.tracker.max_misses = cfg.track_max_misses
+            self.tracker.min_hits = cfg.track_min_hits
+
+    def _to_detections(self, result, frame_shape: Tuple[int, int], min_conf: Optional[float] = None) -> Detections:
+        """Filter a YOLO result with array operations instead of a per-box loop"""
+        boxes = result.boxes
+        conf = boxes.conf.cpu().numpy()
+        keep = conf >= (self.conf_threshold if min_conf is None else min_conf)
+        xyxy = boxes.xyxy.cpu().numpy()[keep].astype(int)
+        class_ids = boxes.cls.cpu().numpy()[keep].astype(int)
+
+        h, w = frame_shape
+        close = (xyxy[:, 2] - xyxy[:, 0]) / w > self.close_threshold
+        return Detections(
+            boxes=xyxy,
+            class_ids=class_ids,
+            confidences=conf[keep],
+            names=[self.model.names[c] for c in class_ids],
+            distances=["close" if c else "far" for c in close],
+            frame_shape=(h, w),
+        )
+
+    def _low_conf(self) -> float:
+        """Threshold YOLO runs at: low enough for tracking, filtered to conf_threshold for speech"""
+        return min(self.track_low_conf, self.conf_threshold)
+
+    def _detect_all(self, frame: np.ndarray) -> Detections:
+        """
+        Run YOLO down to the tracking threshold; a near-duplicate of a recent frame reuses its
+        detections (shared by detect(), track() and detect_batch(), so every mode hits the cache)
+        """
+        key = self.result_cache.key(frame)
+        found, detections = self.result_cache.lookup(key)
+        if found:
+            return detections
+        with metrics.timer("reco.inference"):
+            result = self.model(frame, conf=self._low_conf(), verbose=False)[0]
+        with metrics.timer("reco.postprocess"):
+            detections = self._to_detections(result, frame.shape[:2], min_conf=self._low_conf())
+        self.result_cache.store(key, detections)
+        return detections
+
+    def detect(self, image: ImageInput) -> Detections:
+        """
+        Run YOLO once on an image
+        :param image: BGR frame, or path to the image file
+        :return: Detections above conf_threshold
+        """
+        # Use the frame directly; paths are read for compatibility
+        frame = load_frame(image)
+        if frame is None:
+            raise ValueError(f"Could not read image at {describe(image)}")
+        detections = self._detect_all(frame)
+        return detections.select(detections.confidences >= self.conf_threshold)
         
-    def recognize_objects(self, image_path: str) -> List[str]:
+    def detect_batch(self, frames: List[np.ndarray]) -> List[Detections]:
+        """
+        Run YOLO over many frames, batch_size frames per call
+        Near-duplicates already in the result cache are not sent to the model.
+        :param frames: BGR frames
+        :return: One Detections per frame
+        """
+        frames = list(frames)
+        results: List[Optional[Detections]] = [None] * len(frames)
+        keys = [self.result_cache.key(frame) for frame in frames]
+        misses = []
+        for i, key in enumerate(keys):
+            found, cached = self.result_cache.lookup(key)
+            if found:
+                results[i] = cached
+            else:
+                misses.append(i)
+
+        for chunk_start in range(0, len(misses), self.batch_size):
+            chunk = misses[chunk_start:chunk_start + self.batch_size]
+            with metrics.timer("reco.inference_batch"):
+                batch = self.model([frames[i] for i in chunk], conf=self._low_conf(), verbose=False)
+            for i, result in zip(chunk, batch):
+                results[i] = self._to_detections(result, frames[i].shape[:2], min_conf=self._low_conf())
+                self.result_cache.store(keys[i], results[i])
+        return [d.select(d.confidences >= self.conf_threshold) for d in results]
+
+    def recognize_batch(self, frames: List[np.ndarray]) -> List[List[str]]:
+        """
+        Batched recognize_objects() for recorded footage or bursts of frames
+        :param frames: BGR frames
+        :return: One list of detected objects (formatted strings) per frame
+        """
+        frames = list(frames)
+        try:
+            detections = self.detect_batch(frames)
+        except Exception as e:
+            print(f"Recognition error: {str(e)}")
+            return [[] for _ in frames]
+        if detections:
+            self.last_detections = detections[-1]
+        return [d.to_phrases() for d in detections]
+
+    def recognize_objects(self, image: ImageInput) -> List[str]:
         """
         Perform object recognition on an image
-        :param image_path: Path to the image file
+        :param image: BGR frame, or path to the image file
         :return: List of detected objects (formatted strings)
         """
         try:
-            # Read and process image
-            frame = cv2.imread(image_path)
-            if frame is None:
-                raise ValueError(f"Could not read image at {image_path}")
-            
-            h, w = frame.shape[:2]
-            
-            # Run YOLO inference
-            result = self.model(frame)[0]
-            boxes = result.boxes
-            
-            # Process detections
-            counts = {}
-            for box in boxes:
-                conf = float(box.conf[0])
-                if conf < self.conf_threshold:
-                    continue
-                
-                cls_id = int(box.cls[0])
-                name = self.model.names[cls_id]
-                counts[name] = counts.get(name, 0) + 1
-            
-            # Format results
-            objects = []
-            for cls, cnt in counts.items():
-                label = cls + ("s" if cnt > 1 else "")
-                objects.append(f"{cnt} {label}")
-            
-            self.prev_counts = counts.copy()
-            return objects
+            detections = self.detect(image)
+            self.last_detections = detections
+            return detections.to_phrases()
             
         except Exception as e:
             print(f"Recognition error: {str(e)}")
             return []
 
-    def save_annotated_image(self, image_path: str, output_dir: str = "captures") -> str:
+    def track(self, image: ImageInput):
+        """
+        Detect and associate objects with the tracks of earlier frames
+        Low-confidence boxes are kept for association only, so an object the model is
+        briefly unsure about does not "leave" and "arrive" again.
+        :return: (confirmed tracks visible in this frame, TrackChanges)
+        """
+        frame = load_frame(image)
+        if frame is None:
+            raise ValueError(f"Could not read image at {describe(image)}")
+        detections = self._detect_all(frame)
+        self.last_detections = detections.select(detections.confidences >= self.conf_threshold)
+        with metrics.timer("reco.track"):
+            return self.tracker.update(detections, self.close_threshold, self.conf_threshold)
+
+    def recognize_changes(self, image: ImageInput) -> List[str]:
+        """
+        What changed since the last analysed frame: new objects, objects that left, and
+        objects that came close. The first frame after reset_tracking() lists everything.
+        :param image: BGR frame, or path to the image file
+        :return: Phrases to speak (empty when nothing changed)
+        """
+        try:
+            _, changes = self.track(image)
+            return self.tracker.describe_changes(changes)
+        except Exception as e:
+            print(f"Recognition error: {str(e)}")
+            return []
+
+    def track_ids(self) -> Set[int]:
+        """Ids of every live track, including ones missed on the last few frames"""
+        return {t.track_id for t in self.tracker.tracks}
+
+    def reset_tracking(self):
+        """Forget tracked objects so the next frame is described in full"""
+        self.tracker.clear()
+
+    def save_annotated_image(self, image: ImageInput, output_dir: str = "captures",
+                             detections: Optional[Detections] = None) -> str:
         """
         Save an annotated version of the image with detection results
-        :param image_path: Path to the original image
+        :param image: Original BGR frame, or path to the original image
         :param output_dir: Directory to save annotated image
+        :param detections: Result of detect() for this frame (inference runs only if omitted)
         :return: Path to saved annotated image
         """
         try:
             os.makedirs(output_dir, exist_ok=True)
-            frame = cv2.imread(image_path)
+            frame = load_frame(image)
             if frame is None:
-                raise ValueError(f"Could not read image at {image_path}")
-            
-            h, w = frame.shape[:2]
-            result = self.model(frame)[0]
-            boxes = result.boxes
-            
-            # Draw detections
-            counts = {}
-            for box in boxes:
-                conf = float(box.conf[0])
-                if conf < self.conf_threshold:
-                    continue
-                
-                cls_id = int(box.cls[0])
-                name = self.model.names[cls_id]
-                counts[name] = counts.get(name, 0) + 1
-                
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                box_w = x2 - x1
-                dist_label = "close" if (box_w / w) > self.close_threshold else "far"
-                text = f"{name} ({dist_label})"
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0,255,0), 2)
-                cv2.putText(frame, text, (x1, y1 - 6),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1)
-            
-            # Add counts overlay
-            y0 = 20
-            for cls, cnt in counts.items():
-                cv2.putText(frame, f"{cls}: {cnt}", (10, y0),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,255), 2)
-                y0 += 25
+                raise ValueError(f"Could not read image at {describe(image)}")
+
+            if detections is None:
+                detections = self.detect(frame)
+            annotated = detections.annotate(frame)
             
             # Save annotated image
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            cnt_str = "_".join(f"{k}{v}" for k,v in counts.items())
+            cnt_str = "_".join(f"{k}{v}" for k,v in detections.counts().items())
             fname = f"{ts}_{cnt_str}.jpg"
             output_path = os.path.join(output_dir, fname)
-            cv2.imwrite(output_path, frame)
+            cv2.imwrite(output_path, annotated)
             
             return output_path
             
@@ -110,15 +276,24 @@ class ObjectRecognizer:
             print(f"Error saving annotated image: {str(e)}")
             return ""
 
+registry.register('reco', ObjectRecognizer)
+
 # The following function is what will be imported by the main application
-def recognize_objects(image_path: str) -> List[str]:
+def recognize_objects(image: ImageInput) -> List[str]:
     """
     Standalone function that matches the expected interface
-    :param image_path: Path to the image file
+    :param image: BGR frame, or path to the image file
     :return: List of detected objects (formatted strings)
     """
-    recognizer = ObjectRecognizer()
-    return recognizer.recognize_objects(image_path)
+    return registry.get('reco').recognize_objects(image)
+
+def recognize_object_changes(image: ImageInput) -> List[str]:
+    """
+    Tracked variant of recognize_objects: only what changed since the previous frame
+    :param image: BGR frame, or path to the image file
+    :return: Phrases such as "New: 1 chair" or "Now close: 1 person"
+    """
+    return registry.get('reco').recognize_changes(image)
 
 # Example usage
 if __name__ == "__main__":
@@ -128,8 +303,10 @@ if __name__ == "__main__":
         detected_objects = recognize_objects(test_image)
         print("Detected objects:", ", ".join(detected_objects))
         
-        # Test saving annotated image
-        saved_path = ObjectRecognizer().save_annotated_image(test_image)
+        # Test saving annotated image (reuses the detections above, no second inference)
+        recognizer = registry.get('reco')
+        print("Detections:", recognizer.last_detections.describe())
+        saved_path = recognizer.save_annotated_image(test_image, detections=recognizer.last_detections)
         if saved_path:
             print(f"Saved annotated image to: {saved_path}")
     else:
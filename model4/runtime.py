@@ -0,0 +1,175 @@
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+WEIGHTS = {
+    'n': 'yolov8n.pt',
+    's': 'yolov8s.pt',
+    'm': 'yolov8m.pt',
+    'l': 'yolov8l.pt',
+}
+
+# backend -> (ultralytics export format, suffix of the exported artifact)
+BACKENDS = {
+    'pytorch': (None, '.pt'),
+    'torchscript': ('torchscript', '.torchscript'),
+    'onnx': ('onnx', '.onnx'),
+    'openvino': ('openvino', '_openvino_model'),
+}
+
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), 'exports')
+
+
+class YOLORuntime:
+    def __init__(self, size='l', backend='pytorch', imgsz=640, export_dir=EXPORT_DIR, warmup=True):
+        """
+        YOLO weights or an exported CPU artifact, loaded once and warmed up
+        :param size: Model size: 'n', 's', 'm' or 'l'
+        :param backend: 'pytorch', 'torchscript', 'onnx' or 'openvino'
+        :param imgsz: Inference image size (exported artifacts are fixed to it)
+        :param export_dir: Where exported artifacts are cached between runs
+        :param warmup: Run one dummy inference now so the first real frame is not the slow one
+        """
+        if size not in WEIGHTS:
+            raise ValueError(f"Unknown YOLO size '{size}' (choose from {', '.join(WEIGHTS)})")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown YOLO backend '{backend}' (choose from {', '.join(BACKENDS)})")
+        self.size = size
+        self.backend = backend
+        self.imgsz = imgsz
+        self.export_dir = export_dir
+
+        start = time.perf_counter()
+        artifact = self.resolve_artifact()
+        self.model = YOLO(artifact, task='detect') if backend != 'pytorch' else YOLO(artifact)
+        self.names = self.model.names
+        self.load_time = time.perf_counter() - start
+
+        self.warmup_time = self.warmup() if warmup else 0.0
+
+    @property
+    def label(self) -> str:
+        return f"{self.size}:{self.backend}@{self.imgsz}"
+
+    def resolve_artifact(self) -> str:
+        """Path of the model to load, exporting it once if it is not cached yet"""
+        weights = WEIGHTS[self.size]
+        export_format, suffix = BACKENDS[self.backend]
+        if export_format is None:
+            return weights
+
+        stem = os.path.splitext(weights)[0]
+        cached = os.path.join(self.export_dir, f"{stem}_{self.imgsz}{suffix}")
+        if os.path.exists(cached):
+            return cached
+
+        print(f"Exporting {weights} to {self.backend} (imgsz={self.imgsz}), this happens once...")
+        os.makedirs(self.export_dir, exist_ok=True)
+        exported = YOLO(weights).export(format=export_format, imgsz=self.imgsz)
+        shutil.move(str(exported), cached)
+        return cached
+
+    def warmup(self, runs=1) -> float:
+        """Dummy inference so lazy initialisation happens at startup"""
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(runs):
+            self.model(dummy, imgsz=self.imgsz, verbose=False)
+        return time.perf_counter() - start
+
+    def __call__(self, frames, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        kwargs.setdefault('verbose', False)
+        return self.model(frames, **kwargs)
+
+
+def _class_counts(runtime: YOLORuntime, frame: np.ndarray, conf: float) -> Counter:
+    result = runtime(frame, conf=conf)[0]
+    return Counter(runtime.names[int(c)] for c in result.boxes.cls.cpu().numpy())
+
+
+def agreement(reference: Counter, other: Counter) -> float:
+    """Share of detected objects (by class) both variants agree on: 1.0 = identical counts"""
+    total = max(sum(reference.values()), sum(other.values()))
+    if total == 0:
+        return 1.0
+    return sum((reference & other).values()) / total
+
+
+def benchmark(frames_dir: str, variants: List[str], reference: str, imgsz=640, conf=0.4,
+              limit: Optional[int] = None) -> List[Dict]:
+    """
+    Per-variant load/warm-up time, latency and agreement with a reference variant
+    :param variants: Specs like "n:onnx" (size:backend)
+    :param reference: Spec whose detections count as ground truth
+    """
+    paths = sorted(p for ext in ('jpg', 'jpeg', 'png')
+                   for p in glob.glob(os.path.join(frames_dir, f"*.{ext}")))[:limit]
+    frames = [f for f in (cv2.imread(p) for p in paths) if f is not None]
+    if not frames:
+        raise ValueError(f"No readable frames in {frames_dir}")
+
+    def parse(spec):
+        size, _, backend = spec.partition(':')
+        return size, backend or 'pytorch'
+
+    def run(spec):
+        """Measure one variant; its model is released when this returns"""
+        runtime = YOLORuntime(*parse(spec), imgsz)
+        latencies, counts = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            counts.append(_class_counts(runtime, frame, conf))
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies)
+        return {
+            'variant': runtime.label,
+            'load_s': runtime.load_time,
+            'warmup_s': runtime.warmup_time,
+            'mean_ms': float(latencies.mean() * 1000),
+            'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        }, counts
+
+    measured = [run(spec) for spec in variants]
+    # The reference is only loaded on its own when it is not one of the variants
+    reference_counts = next((counts for spec, (_, counts) in zip(variants, measured)
+                             if parse(spec) == parse(reference)), None)
+    if reference_counts is None:
+        _, reference_counts = run(reference)
+    report = []
+    for row, counts in measured:
+        row['agreement'] = float(np.mean([agreement(r, c) for r, c in zip(reference_counts, counts)]))
+        report.append(row)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare YOLO sizes/backends on a folder of frames")
+    parser.add_argument('frames_dir')
+    parser.add_argument('--variants', nargs='+', default=['n:pytorch', 's:pytorch', 'n:onnx', 'l:pytorch'],
+                        help="size:backend specs, e.g. n:openvino")
+    parser.add_argument('--reference', default='l:pytorch')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.4)
+    parser.add_argument('--limit', type=int, default=None, help="use at most this many frames")
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.frames_dir, args.variants, args.reference, args.imgsz, args.conf, args.limit)
+    print(f"{'variant':<22}{'load s':>8}{'warmup s':>10}{'mean ms':>10}{'p95 ms':>10}{'agree':>8}")
+    for row in report:
+        print(f"{row['variant']:<22}{row['load_s']:>8.2f}{row['warmup_s']:>10.2f}"
+              f"{row['mean_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['agreement']:>8.2f}")
+
+
+# Usage: python -m model4.runtime captures/ --variants n:pytorch n:openvino s:onnx
+if __name__ == "__main__":
+    sys.exit(main())
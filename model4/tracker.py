@@ -0,0 +1,200 @@
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes"""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)))
+    a, b = a[:, None, :].astype(float), b[None, :, :].astype(float)
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+def greedy_match(iou: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """(row, col) pairs, best IoU first, each row and column used once"""
+    pairs = []
+    if not iou.size:
+        return pairs
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols])
+    used_rows, used_cols = set(), set()
+    for i in order:
+        r, c = int(rows[i]), int(cols[i])
+        if r not in used_rows and c not in used_cols:
+            pairs.append((r, c))
+            used_rows.add(r)
+            used_cols.add(c)
+    return pairs
+
+
+@dataclass
+class ObjectTrack:
+    track_id: int
+    box: np.ndarray                 # xyxy, float
+    votes: Dict[str, float] = field(default_factory=dict)  # decayed confidence per class
+    velocity: np.ndarray = field(default_factory=lambda: np.zeros(4))
+    close: bool = False
+    hits: int = 1
+    misses: int = 0
+    confirmed: bool = False
+    announced: bool = False         # its arrival was spoken
+    announced_close: bool = False   # it was spoken of as close
+
+    @property
+    def label(self) -> str:
+        return max(self.votes, key=self.votes.get)
+
+    def predict(self) -> np.ndarray:
+        """Where the box should be on the next analysed frame (constant velocity)"""
+        return self.box + self.velocity
+
+
+@dataclass
+class TrackChanges:
+    """What changed since the previous analysed frame, by smoothed class label"""
+    appeared: List[str] = field(default_factory=list)
+    left: List[str] = field(default_factory=list)
+    came_close: List[str] = field(default_factory=list)
+    initial: bool = False  # first frame after a reset: everything is "new"
+
+    def __bool__(self):
+        return bool(self.appeared or self.left or self.came_close)
+
+
+def _phrases(labels: List[str]) -> List[str]:
+    counts: Dict[str, int] = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    return [f"{cnt} {cls}{'s' if cnt > 1 else ''}" for cls, cnt in counts.items()]
+
+
+class ObjectTracker:
+    def __init__(self, iou_threshold=0.3, low_iou_threshold=0.5, max_misses=2, min_hits=2,
+                 vote_decay=0.7, far_ratio=0.8):
+        """
+        ByteTrack-style association of YOLO boxes across analysed frames
+        High-confidence detections are matched to tracks first; low-confidence ones are
+        then used only to keep existing tracks alive, never to start new ones. Motion is a
+        damped constant-velocity prediction rather than a Kalman filter, which is enough at
+        the low, irregular analysis rates the scheduler produces.
+        :param iou_threshold: Minimum IoU between a prediction and a high-confidence detection
+        :param low_iou_threshold: Stricter IoU for low-confidence detections
+        :param max_misses: Analysed frames a track survives without a detection
+        :param min_hits: Detections needed before a new track is announced
+        :param vote_decay: Weight kept by old class votes on every update
+        :param far_ratio: A close track becomes far again only below far_ratio * close_threshold
+        """
+        self.iou_threshold = iou_threshold
+        self.low_iou_threshold = low_iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.vote_decay = vote_decay
+        self.far_ratio = far_ratio
+        self.tracks: List[ObjectTrack] = []
+        self._ids = count(1)
+        self._first_frame = True
+
+    def clear(self):
+        self.tracks = []
+        self._first_frame = True
+
+    def _update_track(self, track: ObjectTrack, box, label: str, conf: float, width_ratio: float,
+                      close_threshold: float):
+        box = np.asarray(box, dtype=float)
+        track.velocity = 0.5 * track.velocity + 0.5 * (box - track.box)
+        track.box = box
+        for name in track.votes:
+            track.votes[name] *= self.vote_decay
+        track.votes[label] = track.votes.get(label, 0.0) + conf
+        # Hysteresis so a box hovering around the threshold does not flip every frame
+        if width_ratio > close_threshold:
+            track.close = True
+        elif width_ratio < close_threshold * self.far_ratio:
+            track.close = False
+        track.hits += 1
+        track.misses = 0
+        if track.hits >= self.min_hits:
+            track.confirmed = True
+
+    def update(self, detections, close_threshold: float, high_conf: float) -> Tuple[List[ObjectTrack], TrackChanges]:
+        """
+        Associate one frame's detections with the tracks
+        :param detections: Detections including low-confidence boxes
+        :param close_threshold: Box width / frame width above which an object is close
+        :param high_conf: Confidence needed to start a track
+        :return: (confirmed tracks now visible, changes worth announcing)
+        """
+        w = detections.frame_shape[1]
+        boxes = detections.boxes.astype(float)
+        ratios = (boxes[:, 2] - boxes[:, 0]) / w if len(boxes) else np.zeros(0)
+        high = np.nonzero(detections.confidences >= high_conf)[0]
+        low = np.nonzero(detections.confidences < high_conf)[0]
+
+        predicted = np.array([t.predict() for t in self.tracks]).reshape(-1, 4)
+        unmatched_tracks = list(range(len(self.tracks)))
+        unmatched_high = list(high)
+        for stage_dets, threshold in ((high, self.iou_threshold), (low, self.low_iou_threshold)):
+            if not len(stage_dets) or not unmatched_tracks:
+                continue
+            iou = iou_matrix(predicted[unmatched_tracks], boxes[stage_dets])
+            matched_tracks = set()
+            for r, c in greedy_match(iou, threshold):
+                t, d = unmatched_tracks[r], int(stage_dets[c])
+                self._update_track(self.tracks[t], boxes[d], detections.names[d],
+                                   float(detections.confidences[d]), ratios[d], close_threshold)
+                matched_tracks.add(t)
+                if d in unmatched_high:
+                    unmatched_high.remove(d)
+            unmatched_tracks = [t for t in unmatched_tracks if t not in matched_tracks]
+
+        changes = TrackChanges(initial=self._first_frame)
+        for t in unmatched_tracks:
+            self.tracks[t].misses += 1
+        for track in self.tracks:
+            if track.misses > self.max_misses and track.announced:
+                changes.left.append(track.label)
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for d in unmatched_high:
+            track = ObjectTrack(next(self._ids), boxes[d].copy(),
+                                {detections.names[d]: float(detections.confidences[d])},
+                                close=bool(ratios[d] > close_threshold))
+            # As in ByteTrack, tracks of the first frame are trusted immediately
+            track.confirmed = self._first_frame or self.min_hits <= 1
+            self.tracks.append(track)
+        self._first_frame = False
+
+        visible = [t for t in self.tracks if t.confirmed and t.misses == 0]
+        for track in visible:
+            if not track.announced:
+                changes.appeared.append(track.label)
+                track.announced = True
+                track.announced_close = track.close
+            elif track.close and not track.announced_close:
+                changes.came_close.append(track.label)
+                track.announced_close = True
+            elif not track.close:
+                track.announced_close = False  # moving close again later is news again
+        return visible, changes
+
+    @staticmethod
+    def describe_changes(changes: TrackChanges) -> List[str]:
+        """Spoken form, e.g. ["New: 1 chair", "Gone: 2 cups", "Now close: 1 person"]"""
+        if changes.initial:
+            return [f"I see {', '.join(_phrases(changes.appeared))}"] if changes.appeared else []
+        parts = []
+        if changes.appeared:
+            parts.append(f"New: {', '.join(_phrases(changes.appeared))}")
+        if changes.left:
+            parts.append(f"Gone: {', '.join(_phrases(changes.left))}")
+        if changes.came_close:
+            parts.append(f"Now close: {', '.join(_phrases(changes.came_close))}")
+        return parts
@@ -0,0 +1,281 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+
+# Returned by a process callback that did not analyse the frame (e.g. its model is still
+# loading), so the frame counts neither in the stats nor as the scheduler's last analysis
+SKIP = object()
+
+
+class StageStats:
+    def __init__(self, window=100, name: Optional[str] = None):
+        """
+        Rolling latency statistics for one pipeline stage
+        :param name: Also record into this histogram of the shared metrics
+        """
+        self.name = name
+        self.count = 0
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self._samples.append(seconds)
+        if self.name is not None:
+            metrics.observe(self.name, seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {"count": self.count, "last_ms": 0.0, "avg_ms": 0.0, "max_ms": 0.0}
+        return {
+            "count": self.count,
+            "last_ms": samples[-1] * 1000,
+            "avg_ms": sum(samples) / len(samples) * 1000,
+            "max_ms": max(samples) * 1000,
+        }
+
+
+class DropOldestQueue:
+    def __init__(self, maxsize=1):
+        """Bounded queue that discards the oldest item instead of blocking producers"""
+        self._items = collections.deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self._maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                metrics.inc("pipeline.results_dropped")
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None if nothing arrived before the timeout"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def depth(self) -> int:
+        return len(self._items)
+
+
+class LatestFrame:
+    def __init__(self):
+        """Single-slot buffer: the capture stage overwrites, consumers take the newest"""
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self._claimed = 0
+        self._cond = threading.Condition()
+        self.skipped = 0
+        self.wanted = threading.Event()  # set while a consumer waits for a new frame
+
+    def publish(self, frame: np.ndarray):
+        with self._cond:
+            if self._seq > self._claimed:
+                self.skipped += 1  # previous frame was never analysed
+                metrics.inc("pipeline.frames_skipped")
+            self._frame = frame
+            self.wanted.clear()
+            self._seq += 1
+            self._timestamp = time.monotonic()
+            self._cond.notify_all()
+
+    def claim(self, timeout=None) -> Optional[Tuple[int, float, np.ndarray]]:
+        """
+        Take the newest frame no other worker has claimed yet
+        :return: (sequence number, capture timestamp, frame) or None on timeout
+        """
+        with self._cond:
+            if self._seq <= self._claimed:
+                self.wanted.set()
+                self._cond.wait(timeout)
+            if self._seq <= self._claimed:
+                return None
+            self._claimed = self._seq
+            return self._seq, self._timestamp, self._frame
+
+
+class Pipeline:
+    def __init__(self, read_frame: Callable[[], Tuple[bool, Any]],
+                 process: Callable[[int, np.ndarray], Any],
+                 speak: Callable[[str, bool], Any], mode=1, workers=1, min_interval=0.0,
+                 result_queue_size=2, scheduler=None, on_demand=False):
+        """
+        Capture, inference and speech stages running on their own threads
+        :param read_frame: Blocking frame reader with the cv2.VideoCapture.read() signature
+        :param process: Backend call that turns (mode, frame) into text to speak, None, an
+                        iterator of text pieces that are spoken as soon as each is produced,
+                        or SKIP if the frame was not analysed
+        :param speak: Non-blocking speech call taking (text, streamed)
+        :param workers: Number of inference threads
+        :param min_interval: Minimum seconds between inference runs on one worker
+        :param result_queue_size: Bound of the inference -> speech queue (oldest dropped)
+        :param scheduler: Optional AdaptiveScheduler deciding which frames are worth analysing
+        :param on_demand: Read a frame only when an inference worker is waiting for one, instead
+                          of reading (and decoding) every frame the source produces
+        """
+        self.mode = mode
+        self._read_frame = read_frame
+        self._process = process
+        self._speak = speak
+        self._workers = workers
+        self.min_interval = min_interval
+        self.scheduler = scheduler
+        self.on_demand = on_demand
+
+        self.latest = LatestFrame()
+        self.results = DropOldestQueue(result_queue_size)
+        self.stats_by_stage = {name: StageStats(name=f"pipeline.{name}")
+                               for name in ("capture", "inference", "speech", "end_to_end", "first_word")}
+
+        # Backends are shared objects, so concurrent calls into one mode are serialised
+        self._mode_locks = collections.defaultdict(threading.Lock)
+        self._last_spoken_seq = 0
+        self._stop = threading.Event()
+        self._threads = []
+        self.error = None
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._capture_loop, name="capture", daemon=True)]
+        self._threads += [threading.Thread(target=self._inference_loop, name=f"inference-{i}", daemon=True)
+                          for i in range(self._workers)]
+        self._threads.append(threading.Thread(target=self._speech_loop, name="speech-consumer", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def running(self) -> bool:
+        return not self._stop.is_set()
+
+    def set_mode(self, mode: int):
+        """Switch mode; the next frame is analysed without waiting for the schedule"""
+        self.mode = mode
+        if self.scheduler is not None:
+            self.scheduler.reset(mode)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage latency and queue depth snapshot"""
+        stats = {name: stage.snapshot() for name, stage in self.stats_by_stage.items()}
+        stats["queues"] = {
+            "results_depth": self.results.depth(),
+            "results_dropped": self.results.dropped,
+            "frames_skipped": self.latest.skipped,
+        }
+        if self.scheduler is not None:
+            stats["scheduler"] = self.scheduler.snapshot()
+        return stats
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        parts = [f"{name}: {s['avg_ms']:.0f}ms avg / {s['max_ms']:.0f}ms max (n={s['count']})"
+                 for name, s in stats.items() if name in self.stats_by_stage]
+        queues = stats["queues"]
+        parts.append(f"results queue: {queues['results_depth']} "
+                     f"(dropped {queues['results_dropped']}), frames skipped: {queues['frames_skipped']}")
+        if "scheduler" in stats:
+            intervals = ", ".join(f"mode {m}: {i:.1f}s" for m, i in stats["scheduler"]["interval_s"].items())
+            parts.append(f"schedule: {intervals or 'warming up'}, "
+                         f"static frames skipped: {stats['scheduler']['skipped_static']}")
+        return " | ".join(parts)
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            if self.on_demand and not self.latest.wanted.wait(0.1):
+                continue
+            start = time.monotonic()
+            ret, frame = self._read_frame()
+            if not ret:
+                self.error = "Could not read frame"
+                print(f"Error: {self.error}")
+                self._stop.set()
+                break
+            self.stats_by_stage["capture"].record(time.monotonic() - start)
+            self.latest.publish(frame)
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            if self.scheduler is not None:
+                # Sleep (re-checking often enough to notice a mode change) instead of claiming
+                # frames the scheduler would turn down, so on-demand capture never decodes them
+                wait = self.scheduler.next_due(self.mode) - time.monotonic()
+                if wait > 0:
+                    self._stop.wait(min(wait, 0.1))
+                    continue
+            claimed = self.latest.claim(timeout=0.1)
+            if claimed is None:
+                continue
+            seq, captured_at, frame = claimed
+            mode = self.mode
+            if self.scheduler is not None and not self.scheduler.due(mode, frame):
+                continue
+
+            try:
+                with self._mode_locks[mode]:
+                    start = time.monotonic()
+                    output = self._process(mode, frame)
+                    if output is SKIP:
+                        continue
+                    if isinstance(output, str):
+                        if output and mode == self.mode:
+                            self.results.put((seq, captured_at, output, False))
+                    elif output is not None:
+                        self._stream(output, mode, seq, captured_at)
+            except Exception as e:
+                print(f"Processing error: {str(e)}")
+            elapsed = time.monotonic() - start
+            self.stats_by_stage["inference"].record(elapsed)
+            if self.scheduler is not None:
+                self.scheduler.record(mode, frame, elapsed, start)
+
+            # Throttle only the *rate* of analysis; the frame analysed is always the newest
+            if self.min_interval > elapsed:
+                self._stop.wait(self.min_interval - elapsed)
+
+    def _stream(self, pieces, mode: int, seq: int, captured_at: float):
+        """Forward streamed pieces to speech; a mode change or stop cancels the stream"""
+        try:
+            for piece in pieces:
+                if mode != self.mode or self._stop.is_set():
+                    break
+                if piece:
+                    self.results.put((seq, captured_at, piece, True))
+        finally:
+            close = getattr(pieces, "close", None)
+            if close is not None:
+                close()  # lets a generator stop its remaining work
+
+    def _speech_loop(self):
+        while not self._stop.is_set():
+            item = self.results.get(timeout=0.1)
+            if item is None:
+                continue
+            seq, captured_at, text, streamed = item
+            if seq < self._last_spoken_seq:
+                continue  # a newer frame's result already went out
+            first_piece = seq != self._last_spoken_seq
+            self._last_spoken_seq = seq
+
+            start = time.monotonic()
+            self._speak(text, streamed)
+            now = time.monotonic()
+            self.stats_by_stage["speech"].record(now - start)
+            self.stats_by_stage["end_to_end"].record(now - captured_at)
+            if first_piece:
+                self.stats_by_stage["first_word"].record(now - captured_at)
@@ -0,0 +1,114 @@
+import gc
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+
+class ModelRegistry:
+    def __init__(self):
+        """Keep a single warm instance of every registered backend"""
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._unload_hooks: Dict[str, Optional[Callable[[Any], None]]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._last_used: Dict[str, float] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._pinned: Set[str] = set()
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any],
+                 on_unload: Optional[Callable[[Any], None]] = None, pinned=False):
+        """
+        Register a backend factory (nothing is built until first use)
+        :param name: Key used by the application, e.g. 'reco'
+        :param factory: Zero-argument callable that builds the engine
+        :param on_unload: Optional hook called with the instance before it is dropped
+        :param pinned: Ignore later unpinned registrations under this name (worker-process
+                       proxies, which importing the backend module must not replace)
+        """
+        with self._lock:
+            if name in self._pinned and not pinned:
+                return
+            self._factories[name] = factory
+            self._unload_hooks[name] = on_unload
+            self._build_locks.setdefault(name, threading.Lock())
+            if pinned:
+                self._pinned.add(name)
+
+    def get(self, name: str) -> Any:
+        """Return the warm instance for a backend, building it on first use"""
+        instance = self._instances.get(name)
+        if instance is None:
+            instance = self.load(name)
+        self._last_used[name] = time.monotonic()
+        return instance
+
+    def load(self, name: str) -> Any:
+        """Build a backend now (no-op if it is already loaded)"""
+        if name not in self._factories:
+            raise KeyError(f"No model registered under '{name}'")
+
+        # Per-model lock so two callers never build the same engine twice
+        with self._build_locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                instance = self._factories[name]()
+                with self._lock:
+                    self._instances[name] = instance
+                    self._last_used[name] = time.monotonic()
+        return instance
+
+    def unload(self, name: str) -> bool:
+        """
+        Drop a loaded backend so its memory can be reclaimed
+        :return: True if an instance was actually unloaded
+        """
+        with self._build_locks.get(name, threading.Lock()):
+            with self._lock:
+                instance = self._instances.pop(name, None)
+                self._last_used.pop(name, None)
+            if instance is None:
+                return False
+
+            hook = self._unload_hooks.get(name)
+            if hook is not None:
+                try:
+                    hook(instance)
+                except Exception as e:
+                    print(f"Unload hook error for {name}: {str(e)}")
+        del instance
+        gc.collect()
+        return True
+
+    def unload_idle(self, max_idle: float, keep: Iterable[str] = ()) -> List[str]:
+        """
+        Unload every backend not used for max_idle seconds
+        :param max_idle: Idle time in seconds before a backend is dropped
+        :param keep: Names that must stay loaded regardless of idle time
+        :return: Names of the backends that were unloaded
+        """
+        now = time.monotonic()
+        keep = set(keep)
+        with self._lock:
+            idle = [name for name, last in self._last_used.items()
+                    if name not in keep and now - last >= max_idle]
+        return [name for name in idle if self.unload(name)]
+
+    def peek(self, name: str) -> Any:
+        """Return the instance if loaded, without building it or marking it as used"""
+        return self._instances.get(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def loaded(self) -> List[str]:
+        return list(self._instances)
+
+    def registered(self) -> List[str]:
+        return list(self._factories)
+
+    def is_pinned(self, name: str) -> bool:
+        return name in self._pinned
+
+
+# Shared by every backend module and main.py
+registry = ModelRegistry()
@@ -0,0 +1,124 @@
+import collections
+import copy
+import functools
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from frames import load_frame
+
+
+def frame_hash(frame: np.ndarray, hash_size=8) -> int:
+    """
+    Difference hash (dHash) of a frame: near-identical frames get nearby hashes
+    :param hash_size: Side of the hash grid; the hash has hash_size**2 bits
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class ResultCache:
+    def __init__(self, max_entries=32, ttl=10.0, max_distance=4, hash_size=8):
+        """
+        Bounded LRU of backend results keyed on a perceptual frame hash
+        :param max_entries: Results kept before the least recently used is evicted
+        :param ttl: Seconds a result stays valid
+        :param max_distance: Hamming distance under which two frames count as the same scene
+        :param hash_size: dHash grid side (larger tells apart finer detail, e.g. text)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self._entries: "collections.OrderedDict[int, Tuple[float, Any]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, frame: np.ndarray) -> int:
+        return frame_hash(frame, self.hash_size)
+
+    def lookup(self, key: int) -> Tuple[bool, Any]:
+        """
+        Find the result of a near-duplicate frame
+        :return: (found, result)
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Expire old entries first so they never match
+            for stale in [k for k, (stored, _) in self._entries.items() if now - stored > self.ttl]:
+                del self._entries[stale]
+                self.evictions += 1
+
+            best_key, best_distance = None, self.max_distance + 1
+            for k in self._entries:
+                distance = hamming(k, key)
+                if distance < best_distance:
+                    best_key, best_distance = k, distance
+                    if distance == 0:
+                        break
+
+            if best_key is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return True, self._entries[best_key][1]
+
+    def store(self, key: int, result: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def cached_by_frame(method):
+    """
+    Serve a backend method from self.result_cache when the frame is a near-duplicate
+    The wrapped method must take the image as its only argument.
+    """
+    @functools.wraps(method)
+    def wrapper(self, image, *args, **kwargs):
+        cache: Optional[ResultCache] = getattr(self, "result_cache", None)
+        if cache is None or args or kwargs:
+            return method(self, image, *args, **kwargs)
+
+        frame = load_frame(image)
+        if frame is None:
+            return method(self, image)
+
+        key = cache.key(frame)
+        found, result = cache.lookup(key)
+        if found:
+            return copy.copy(result)
+        result = method(self, frame)
+        cache.store(key, copy.copy(result))
+        return result
+    return wrapper
@@ -0,0 +1,141 @@
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+THUMB_SIZE = (32, 24)  # (width, height) used for all scene-change comparisons
+
+
+def thumbnail(frame: np.ndarray, size=THUMB_SIZE) -> np.ndarray:
+    """Tiny grayscale copy of a frame, cheap enough to compute on every capture"""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def change_score(prev_thumb: Optional[np.ndarray], thumb: np.ndarray) -> float:
+    """
+    How different two thumbnails are
+    :return: 0.0 for identical scenes up to 1.0 for completely different ones
+    """
+    if prev_thumb is None or prev_thumb.shape != thumb.shape:
+        return 1.0
+    diff = cv2.absdiff(prev_thumb, thumb)
+    return float(diff.mean()) / 255.0
+
+
+class AdaptiveScheduler:
+    def __init__(self, cpu_budget=0.5, min_interval=0.1, max_interval=15.0,
+                 change_threshold=0.04, smoothing=0.3, check_interval=0.5):
+        """
+        Decide when the next frame should be analysed
+        :param cpu_budget: Fraction of wall time inference may use (0.5 = half a core)
+        :param min_interval: Never analyse more often than this (seconds)
+        :param max_interval: Re-analyse a static scene after this long anyway (seconds)
+        :param change_threshold: Change score above which the scene counts as changed
+        :param smoothing: Weight of the newest sample in the per-mode latency average
+        :param check_interval: Seconds between change checks once a scene was found static
+        """
+        self.cpu_budget = cpu_budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change_threshold = change_threshold
+        self.smoothing = smoothing
+        self.check_interval = check_interval
+
+        self._latency: Dict[int, float] = {}
+        self._last_run: Dict[int, float] = {}
+        self._last_thumb: Dict[int, np.ndarray] = {}
+        self._next_check: Dict[int, float] = {}  # mode -> earliest next change check
+        self._lock = threading.Lock()
+        self.skipped_static = 0
+
+    @classmethod
+    def from_config(cls, cfg) -> 'AdaptiveScheduler':
+        """Build from the pipeline section of config.py"""
+        scheduler = cls()
+        scheduler.apply_config(cfg)
+        return scheduler
+
+    def apply_config(self, cfg):
+        """Take new rate limits; latency history is kept"""
+        self.cpu_budget = cfg.cpu_budget
+        self.min_interval = cfg.min_process_interval
+        self.max_interval = cfg.max_process_interval
+        self.change_threshold = cfg.scene_change_threshold
+        self.check_interval = cfg.scene_check_interval
+
+    def interval(self, mode: int) -> float:
+        """Fastest analysis period the CPU budget allows for this mode"""
+        latency = self._latency.get(mode)
+        if latency is None:
+            return self.min_interval
+        return min(self.max_interval, max(self.min_interval, latency / self.cpu_budget))
+
+    def next_due(self, mode: int) -> float:
+        """
+        Earliest time.monotonic() at which a frame could be due in this mode
+        Callers may sleep until then instead of fetching frames that would be turned down.
+        """
+        with self._lock:
+            last_run = self._last_run.get(mode)
+            if last_run is None:
+                return 0.0
+            due_at = last_run + self.interval(mode)
+            return min(max(due_at, self._next_check.get(mode, 0.0)), last_run + self.max_interval)
+
+    def due(self, mode: int, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """True if this frame should be analysed now"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last_run = self._last_run.get(mode)
+            if last_run is None:
+                return True  # first frame in this mode
+            elapsed = now - last_run
+            if elapsed >= self.max_interval:
+                return True
+            if elapsed < self.interval(mode) or now < self._next_check.get(mode, 0.0):
+                return False
+
+            # Within the refresh window only a changed scene is worth re-analysing,
+            # and a static one is only looked at again every check_interval
+            score = change_score(self._last_thumb.get(mode), thumbnail(frame))
+            if score < self.change_threshold:
+                self._next_check[mode] = now + self.check_interval
+                self.skipped_static += 1
+                metrics.inc("pipeline.static_skipped")
+                return False
+            return True
+
+    def record(self, mode: int, frame: np.ndarray, latency: float, started: float):
+        """Store the outcome of an analysis run"""
+        thumb = thumbnail(frame)
+        with self._lock:
+            previous = self._latency.get(mode)
+            self._latency[mode] = latency if previous is None else (
+                self.smoothing * latency + (1 - self.smoothing) * previous)
+            self._last_run[mode] = started
+            self._last_thumb[mode] = thumb
+            self._next_check.pop(mode, None)
+
+    def reset(self, mode: Optional[int] = None):
+        """Forget the last run so the next frame is analysed immediately (e.g. on mode change)"""
+        with self._lock:
+            for runs in (self._last_run, self._last_thumb, self._next_check):
+                if mode is None:
+                    runs.clear()
+                else:
+                    runs.pop(mode, None)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            modes = list(self._latency)
+        return {
+            "latency_ms": {mode: self._latency[mode] * 1000 for mode in modes},
+            "interval_s": {mode: self.interval(mode) for mode in modes},
+            "skipped_static": self.skipped_static,
+        }
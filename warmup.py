@@ -0,0 +1,143 @@
+import importlib
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import metrics
+from registry import registry
+
+# Registry name -> module whose import registers it
+BACKEND_MODULES = {
+    'tts': 'model1.voice',
+    'reco': 'model4.reco',
+    'face': 'model3.face_detection',
+    'ocr': 'model2.ocr',
+    'auto': 'cascade',
+}
+
+
+def import_backend(name: str) -> float:
+    """
+    Import the module that registers a backend
+    :return: Seconds the import took (0 if it was already imported or runs in a worker process)
+    """
+    module = BACKEND_MODULES[name]
+    if module in sys.modules or registry.is_pinned(name):
+        return 0.0
+    start = time.perf_counter()
+    importlib.import_module(module)
+    return time.perf_counter() - start
+
+
+def load_backend(name: str) -> Any:
+    """Import and build a backend now (no-op once it is loaded)"""
+    import_backend(name)
+    return registry.load(name)
+
+
+class BackgroundLoader:
+    def __init__(self, prepare: Optional[Callable[[str], None]] = None,
+                 on_ready: Optional[Callable[[str], None]] = None,
+                 on_failed: Optional[Callable[[str, str], None]] = None):
+        """
+        Import and build backends one at a time on a background thread, most wanted first,
+        so startup never waits for a model and a mode switch never blocks on one
+        :param prepare: Called with the name before the import and the build
+                        (e.g. to swap in a worker-process proxy)
+        :param on_ready: Called with the name once the backend is loaded
+        :param on_failed: Called with the name and the error if it could not be loaded
+        """
+        self.prepare = prepare
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.timings: Dict[str, Dict[str, float]] = {}  # name -> {'import_s', 'init_s'}
+        self.failed: Dict[str, str] = {}
+        self._queue: List[str] = []
+        self._current: Optional[str] = None
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        self._thread.start()
+
+    def request(self, *names: str, urgent=False):
+        """Queue backends that are not loaded yet; urgent ones go before everything queued"""
+        with self._cond:
+            for name in reversed(names) if urgent else names:
+                if registry.is_loaded(name) or name == self._current:
+                    continue
+                self.failed.pop(name, None)  # asking again retries a failed load
+                if name in self._queue:
+                    if not urgent:
+                        continue
+                    self._queue.remove(name)
+                if urgent:
+                    self._queue.insert(0, name)
+                else:
+                    self._queue.append(name)
+            self._cond.notify()
+
+    def ready(self, *names: str) -> bool:
+        """True once every one of the backends is loaded"""
+        return all(registry.is_loaded(name) for name in names)
+
+    def pending(self) -> List[str]:
+        with self._cond:
+            return ([self._current] if self._current else []) + list(self._queue)
+
+    def wait(self, timeout=None) -> bool:
+        """Block until nothing is queued or loading (used by benchmarks and tests)"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and self._current is None, timeout)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._queue = []
+            self._cond.notify_all()
+        # A build in progress cannot be interrupted; the daemon thread dies with the process
+
+    def report(self) -> str:
+        """Per-backend import / build time breakdown"""
+        parts = [f"{name}: import {t['import_s']:.1f}s + init {t['init_s']:.1f}s"
+                 for name, t in self.timings.items()]
+        parts += [f"{name}: failed ({error})" for name, error in self.failed.items()]
+        return " | ".join(parts)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._current = None
+                self._cond.notify_all()  # wake wait()
+                self._cond.wait_for(lambda: self._queue or not self._running)
+                if not self._running:
+                    return
+                name = self._current = self._queue.pop(0)
+            self._load(name)
+            if not self._queue:
+                print(f"Models loaded: {self.report()}")
+
+    def _load(self, name: str):
+        try:
+            import_s = 0.0
+            if self.prepare is not None:
+                start = time.perf_counter()
+                self.prepare(name)  # before the import, which a worker-process proxy makes unnecessary
+                import_s = time.perf_counter() - start
+            import_s += import_backend(name)
+            start = time.perf_counter()
+            registry.load(name)
+            init_s = time.perf_counter() - start
+        except Exception as e:  # a missing or broken backend only disables its mode
+            self.failed[name] = str(e)
+            print(f"Could not load {name}: {str(e)}")
+            if self.on_failed is not None:
+                self.on_failed(name, str(e))
+            return
+
+        self.timings[name] = {'import_s': import_s, 'init_s': init_s}
+        metrics.observe(f"{name}.import", import_s)
+        metrics.observe(f"{name}.init", init_s)
+        print(f"{name} ready (import {import_s:.1f}s, init {init_s:.1f}s)")
+        if self.on_ready is not None:
+            self.on_ready(name)
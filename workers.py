@@ -0,0 +1,332 @@
+import functools
+import importlib
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from metrics import metrics
+from registry import registry
+
+# Registry name -> module whose import registers the real backend
+WORKER_MODULES = {'reco': 'model4.reco', 'face': 'model3.face_detection', 'ocr': 'model2.ocr'}
+
+# Native thread pools that otherwise start one thread per core in every process
+THREAD_ENV = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+              'VECLIB_MAXIMUM_THREADS')
+
+
+class WorkerError(RuntimeError):
+    """The worker process crashed, timed out or is being restarted"""
+
+
+class FrameRing:
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None):
+        """
+        Fixed-size frame slots in one shared memory block
+        The main process creates the block and writes frames into free slots; the worker
+        attaches by name and reads them, so frames never go through pickle or the pipe.
+        :param name: Attach to an existing block instead of creating one
+        """
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=slots * slot_bytes if self.owner else 0)
+        self.name = self.shm.name
+
+    def view(self, slot: int, shape, dtype) -> np.ndarray:
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot: int, frame: np.ndarray):
+        self.view(slot, frame.shape, frame.dtype)[...] = frame
+
+    def read(self, slot: int, shape, dtype) -> np.ndarray:
+        """Copy a frame out, so the backend may keep or modify it after the slot is reused"""
+        return self.view(slot, shape, dtype).copy()
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(name: str, conn, threads: int, argv: List[str]):
+    """Entry point of a worker process: build one backend and serve calls until told to stop"""
+    # Thread pools read these when they are first imported, so set them before anything heavy
+    for var in THREAD_ENV:
+        os.environ[var] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+
+    from config import config_file_changed, get_config, load_config, reload_config
+    load_config(argv)
+    importlib.import_module(WORKER_MODULES[name])
+    engine = registry.load(name)
+    methods = [m for m in dir(engine) if not m.startswith('_') and callable(getattr(type(engine), m, None))]
+    conn.send(('ready', os.getpid(), methods))
+
+    ring = None
+    while True:
+        # Between calls, pick up config file edits the same way the main process does
+        if not conn.poll(get_config().pipeline.config_poll_interval or None):
+            if config_file_changed():
+                reload_config()  # applies it as well
+            continue
+        message = conn.recv()
+        kind = message[0]
+        if kind == 'stop':
+            break
+        elif kind == 'ring':
+            if ring is not None:
+                ring.close()
+            ring = FrameRing(message[2], message[3], name=message[1])
+        elif kind == 'call':
+            _, call_id, method, frame_ref, args, kwargs = message
+            try:
+                if frame_ref is not None:
+                    slot, shape, dtype, batch = frame_ref
+                    frames = ring.read(slot, shape, dtype)
+                    args = (list(frames) if batch else frames, *args)
+                result = getattr(registry.get(name), method)(*args, **kwargs)
+                if isinstance(result, types.GeneratorType):
+                    result = list(result)  # generators cannot cross the pipe; send every piece at once
+                conn.send(('result', call_id, True, result))
+            except Exception as e:
+                conn.send(('result', call_id, False, f"{type(e).__name__}: {str(e)}"))
+
+    if ring is not None:
+        ring.close()
+    registry.unload(name)
+
+
+def _same_frames(frames) -> bool:
+    """True for a list of numpy frames that share one shape and dtype (so they can be stacked)"""
+    first = frames[0]
+    return isinstance(first, np.ndarray) and all(
+        isinstance(f, np.ndarray) and f.shape == first.shape and f.dtype == first.dtype for f in frames)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+
+class RemoteBackend:
+    def __init__(self, name: str, threads=2, timeout=30.0, slots=2, argv: Optional[List[str]] = None):
+        """
+        A backend running in its own process, used through the registry like the local engine
+        Public methods of the engine are forwarded; a numpy frame (or a list of equally sized
+        frames, as batch calls take) passed as the first argument travels through a shared
+        memory ring, everything else (and the result) over a pipe.
+        A crashed or hung worker is restarted in the background while callers get WorkerError,
+        so the capture loop and the other modes keep running.
+        :param name: Registry name of the backend ('reco', 'face' or 'ocr')
+        :param threads: Native threads the worker may use (torch, OpenMP, OpenCV)
+        :param timeout: Seconds a call may take before the worker is considered hung
+        :param slots: Frames that can be in flight at once (one per inference thread is enough)
+        :param argv: Command line the worker loads its config from (defaults to this process's)
+        """
+        self.name = name
+        self.threads = threads
+        self.timeout = timeout
+        self.slots = slots
+        self.argv = sys.argv[1:] if argv is None else list(argv)
+        self.restarts = 0
+        self._methods = set()
+        self._context = multiprocessing.get_context('spawn')  # fork would copy our threads and locks
+        self._process = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._restarting = False
+        self._closed = False
+        self._failures = 0  # consecutive crashes, for backoff
+        self._ids = itertools.count(1)
+        self._calls: Dict[int, _Call] = {}
+        self._ring: Optional[FrameRing] = None
+        self._free: List[int] = list(range(slots))
+        self._slots_cond = threading.Condition()
+        self._start()
+
+    def _start(self):
+        """Spawn the worker and wait until its model is loaded"""
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, name=f"nayan-{self.name}", daemon=True,
+                                        args=(self.name, child_conn, self.threads, self.argv))
+        start = time.monotonic()
+        process.start()
+        child_conn.close()  # so a dead worker shows up as EOF on our end
+        while not conn.poll(0.5):
+            if not process.is_alive():
+                conn.close()
+                raise WorkerError(f"{self.name} worker exited during startup (code {process.exitcode})")
+        _, pid, methods = conn.recv()
+        self._methods = set(methods)
+        self._process, self._conn = process, conn
+        with self._send_lock:
+            if self._ring is not None:
+                conn.send(('ring', self._ring.name, self._ring.slots, self._ring.slot_bytes))
+        threading.Thread(target=self._collect, args=(conn, process), name=f"{self.name}-results",
+                         daemon=True).start()
+        metrics.observe(f"{self.name}.worker_startup", time.monotonic() - start)
+        print(f"{self.name} worker started (pid {pid}, {self.threads} threads)")
+
+    def __getattr__(self, method: str):
+        if method.startswith('_') or method not in self._methods:
+            raise AttributeError(f"'{self.name}' worker has no method '{method}'")
+        return functools.partial(self.call, method)
+
+    def apply_config(self, cfg):
+        """Workers poll the config file themselves, so there is nothing to forward"""
+
+    def call(self, method: str, *args, **kwargs):
+        """Run engine.method(*args, **kwargs) in the worker and return its result"""
+        if self._restarting or self._closed:
+            raise WorkerError(f"{self.name} worker is restarting")
+        slot, frame_ref = None, None
+        frame, batch = (args[0] if args else None), False
+        if isinstance(frame, (list, tuple)) and frame and _same_frames(frame):
+            frame, batch = np.stack(frame), True  # one slot holds the whole batch
+        if isinstance(frame, np.ndarray):
+            frame = np.ascontiguousarray(frame)
+            slot = self._acquire_slot(frame.nbytes)
+            self._ring.write(slot, frame)
+            frame_ref, args = (slot, frame.shape, frame.dtype.str, batch), args[1:]
+
+        call_id = next(self._ids)
+        call = self._calls[call_id] = _Call()
+        try:
+            with metrics.timer(f"{self.name}.worker_call"):
+                with self._send_lock:
+                    self._conn.send(('call', call_id, method, frame_ref, args, kwargs))
+                if not call.done.wait(self.timeout):
+                    self._restart(f"did not answer {method}() within {self.timeout:.0f}s")
+                    raise WorkerError(f"{self.name} worker timed out")
+        except (OSError, ValueError):  # pipe already closed by a crash
+            raise WorkerError(f"{self.name} worker is restarting")
+        finally:
+            self._calls.pop(call_id, None)
+            if slot is not None:
+                self._release_slot(slot)
+
+        if isinstance(call.value, WorkerError):
+            raise call.value
+        if not call.ok:
+            raise RuntimeError(f"{self.name} worker: {call.value}")
+        self._failures = 0
+        return call.value
+
+    def _acquire_slot(self, nbytes: int) -> int:
+        with self._slots_cond:
+            if self._ring is None or nbytes > self._ring.slot_bytes:
+                # First frame or a bigger resolution: reallocate once nothing is in flight
+                self._slots_cond.wait_for(lambda: len(self._free) == self.slots)
+                if self._ring is None or nbytes > self._ring.slot_bytes:
+                    old, self._ring = self._ring, FrameRing(self.slots, nbytes)
+                    with self._send_lock:
+                        self._conn.send(('ring', self._ring.name, self.slots, nbytes))
+                    if old is not None:
+                        old.close()
+            self._slots_cond.wait_for(lambda: self._free)
+            return self._free.pop()
+
+    def _release_slot(self, slot: int):
+        with self._slots_cond:
+            self._free.append(slot)
+            self._slots_cond.notify_all()
+
+    def _collect(self, conn, process):
+        """Hand results to the waiting callers; EOF means the worker died"""
+        while True:
+            try:
+                _, call_id, ok, value = conn.recv()
+            except (EOFError, OSError):
+                break
+            call = self._calls.get(call_id)
+            if call is not None:
+                call.ok, call.value = ok, value
+                call.done.set()
+        if conn is self._conn and not self._closed:
+            process.join(1.0)
+            self._restart(f"exited (code {process.exitcode})")
+
+    def _restart(self, reason: str):
+        with self._state_lock:
+            if self._restarting or self._closed:
+                return
+            self._restarting = True
+        print(f"{self.name} worker {reason}; restarting it")
+        metrics.inc("worker.restarts")
+        self.restarts += 1
+        for call in list(self._calls.values()):
+            call.value = WorkerError(f"{self.name} worker {reason}")
+            call.done.set()
+        threading.Thread(target=self._restart_worker, name=f"{self.name}-restart", daemon=True).start()
+
+    def _restart_worker(self):
+        self._stop_process(graceful=False)
+        while not self._closed:
+            # Back off when the model keeps crashing on startup or on every frame
+            time.sleep(min(2 ** self._failures, 30))
+            self._failures += 1
+            try:
+                self._start()
+                break
+            except Exception as e:
+                print(f"{self.name} worker restart failed: {str(e)}")
+        self._restarting = False
+
+    def _stop_process(self, graceful=True):
+        process, conn = self._process, self._conn
+        if process is None:
+            return
+        if graceful and process.is_alive():
+            try:
+                with self._send_lock:
+                    conn.send(('stop',))
+                process.join(5.0)
+            except (OSError, ValueError):
+                pass
+        if process.is_alive():
+            process.terminate()
+            process.join(2.0)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def close(self):
+        """Stop the worker (its model is unloaded there) and free the shared memory"""
+        self._closed = True
+        self._stop_process()
+        with self._slots_cond:
+            if self._ring is not None:
+                self._ring.close()
+                self._ring = None
+
+
+def use_process_backends(cfg, argv: Optional[List[str]] = None, names=tuple(WORKER_MODULES)):
+    """
+    Re-register backends so the registry builds worker-process proxies instead of local engines
+    The proxies are pinned, so the backend modules (and torch, easyocr or dlib with them) need
+    not be imported here: if one is imported later its own registration is ignored.
+    :param cfg: Pipeline section of the config
+    :param argv: Command line the workers load their config from
+    """
+    for name in names:
+        factory = functools.partial(RemoteBackend, name, cfg.worker_threads, cfg.worker_timeout,
+                                    max(2, cfg.inference_workers + 1), argv)
+        registry.register(name, factory, on_unload=RemoteBackend.close, pinned=True)